@@ -1,25 +1,91 @@
 #!/usr/bin/env python3
 import argparse
-import json
 import os
 import time
 import logging
+import logging.handlers
+import queue
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, nullcontext
 from datetime import datetime, UTC
 from zoneinfo import ZoneInfo
 
 import numpy as np
 import h5py
 
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+import config_loader
 from scope_utils import ScopeManager
 
 TZ = ZoneInfo("Europe/Copenhagen")
 DEBUG = False
 
+log = logging.getLogger("acquire")
+
+# Chunks på ~1 MiB matcher HDF5's chunk-cache, og cachen rummer flere chunks
+CHUNK_BYTES = 1 << 20
+H5_CACHE = {"rdcc_nbytes": 8 * 1024 * 1024, "rdcc_nslots": 521}
+
+# Nyere filformat (v1.10+): kompakte grupper/attributter og B-tree v2 gør
+# metadata for mange sweep-grupper mindre. Nedre grænse v110 holder filerne
+# læsbare for HDF5 1.10+, og SWMR kræver mindst v110.
+H5_LIBVER = ("v110", "latest")
+
+# layout="channels": chunks dækker CHUNK_COLS punkter × mange sweeps, så både
+# én sweep (række) og ét punkt over tid (søjle) rammer få chunks. En sweep
+# skriver i alle chunks i sin række, så cachen skal rumme hele rækken af
+# chunks indtil de er fyldt, ellers genkomprimeres de ved hver sweep.
+# Chunk-højden begrænses så en række af chunks højst fylder ROW_CACHE_BYTES,
+# og cachen dimensioneres pr. dataset efter den række (se h5_cache_2d()).
+CHUNK_COLS = 4096
+ROW_CACHE_BYTES = 64 * 1024 * 1024
+
+# layout="channels": én række pr. sweep i sweeps_meta. Tidsstemplet gemmes
+# som epoch-ns (int64, kan læses som datetime64[ns]) og formateres først ved
+# læsning med ns_to_iso()
+SWEEP_META_DTYPE = np.dtype([("timestamp_ns", "<i8")])
+
+# :WAV:PRE? er konstant så længe kanal/format/punkter/tidsbase er uændret.
+# Nøgle: (source, format, points_mode, points, acq_type) -> parset skalering
+_pre_cache = {}
+
+# Færdigbyggede :WAV-opsætningsstrenge, én sammensat (;-adskilt) skrivning pr.
+# kanal i stedet for 4-5 enkelte. Nøgle: (source, format, points_mode, points)
+_setup_cmds = {}
+
+
+def waveform_setup_cmd(src, fmt, points, points_mode="RAW"):
+    key = (src, fmt, points_mode, points)
+    cmd = _setup_cmds.get(key)
+    if cmd is None:
+        # Points mode sættes altid: den er gemt i scopet, og et NORM efterladt
+        # af fx dashboardets preview ville skære optagelsen ned til skærmopløsning
+        parts = [f":WAV:SOUR {src}", f":WAV:FORM {fmt}",
+                 f":WAV:POIN:MODE {points_mode}", f":WAV:POIN {points}"]
+        if fmt == "WORD":
+            # LSBFirst = værtens (x86/ARM) byte-rækkefølge: ingen byteswap ved læsning
+            parts += [":WAV:UNS 0", ":WAV:BYT LSBFirst"]
+        else:
+            parts.append(":WAV:UNS 1")
+        cmd = _setup_cmds[key] = ";".join(parts)
+    return cmd
+
 
 def now_pair():
     return datetime.now(TZ).isoformat(), datetime.now(UTC).isoformat()
 
 
+def ns_to_iso(ns, tz=TZ):
+    """Epoch-ns (fx fra sweeps_meta) -> ISO-8601 i tz, med µs-opløsning."""
+    sec, rest = divmod(int(ns), 1_000_000_000)
+    return datetime.fromtimestamp(sec, tz).replace(microsecond=rest // 1000).isoformat()
+
+
 def W(scope, cmd, sleep=0.0):
     scope.write(cmd)
     if sleep:
@@ -42,13 +108,16 @@ def read_ieee_block(scope, cmd):
     if not data:
         return data
 
-    if data.startswith(b"#") and len(data) > 2:
+    if data[:1] == b"#" and len(data) > 2:
+        # Header parses direkte på bytes: '#<nd><len>', ingen decode/str
+        mv = memoryview(data)
+        nd = data[1] - 0x30
         try:
-            nd = int(chr(data[1]))
-            nlen = int(data[2:2+nd].decode())
-            return data[2+nd:2+nd+nlen]
-        except:
+            nlen = int(mv[2:2+nd])
+        except ValueError:
             return data
+        # memoryview-slice: ingen kopi af payload
+        return mv[2+nd:2+nd+nlen]
 
     return data
 
@@ -62,50 +131,69 @@ def open_scope_with_autodetect(config):
     if mgr.scope is None:
         raise RuntimeError("Kan ikke autodetektere scope.")
 
-    # Print IDN
-    print(mgr.idn())
+    log.info("Scope: %s", mgr.idn().strip())
     return mgr
 
 
-def read_waveform(scope, channel_cfg, acq_cfg):
+def invalidate_preamble_cache():
+    """Glem cachede preambler (kald ved ændret scope-/acq-opsætning)."""
+    _pre_cache.clear()
+
+
+def parse_preamble(text):
+    """
+    :WAV:PRE? (10 kommaseparerede tal) parses i ét C-kald.
+    Returnerer (x_increment, x_origin, x_reference, y_increment, y_origin, y_reference).
+    """
+    pre = np.fromstring(text, sep=",")
+    if pre.size < 10:
+        raise ValueError(f"Uventet :WAV:PRE? svar: {text!r}")
+    return tuple(pre[4:10].tolist())
+
+
+def digitize(scope, channels):
+    """
+    Én samtidig optagelse af alle kanalerne (:DIGITIZE CHAN1,CHAN2,...),
+    så en sweeps kanaler hører til samme trigger og kun hentes bagefter.
+    """
+    sources = ",".join(ch["source"] for ch in channels)
+    Q(scope, f":DIGITIZE {sources};*OPC?")
+
+
+def read_waveform(scope, channel_cfg, acq_cfg, acquire=True):
+    """
+    Henter én kanals waveform. Med acquire=False er optagelsen allerede
+    lavet (se digitize()), og kun data for kanalen overføres.
+    """
     src = channel_cfg["source"]
     points = int(acq_cfg["points"])
     fmt = acq_cfg.get("waveform_format", "WORD").upper()
+    points_mode = acq_cfg.get("points_mode", "RAW").upper()
+    pre_key = (src, fmt, points_mode, points, acq_cfg.get("acq_type"))
 
-    W(scope, f":WAV:SOUR {src}")
-    W(scope, f":WAV:FORM {fmt}")
-    W(scope, f":WAV:POIN {points}")
-
-    if fmt == "WORD":
-        W(scope, ":WAV:UNS 0")
-        W(scope, ":WAV:BYT MSBFirst")
+    setup = waveform_setup_cmd(src, fmt, points, points_mode)
+    if acquire:
+        Q(scope, setup + ";:DIGITIZE;*OPC?")
     else:
-        W(scope, ":WAV:UNS 1")
+        W(scope, setup)
 
-    W(scope, ":DIGITIZE")
-    Q(scope, "*OPC?")
-
-    pre = Q(scope, ":WAV:PRE?").split(",")
-
-    xinc = float(pre[4])
-    xorg = float(pre[5])
-    xref = float(pre[6])
-    yinc = float(pre[7])
-    yorg = float(pre[8])
-    yref = float(pre[9])
+    scaling = _pre_cache.get(pre_key)
+    if scaling is None:
+        scaling = _pre_cache[pre_key] = parse_preamble(Q(scope, ":WAV:PRE?"))
+    xinc, xorg, xref, yinc, yorg, yref = scaling
 
     payload = read_ieee_block(scope, ":WAV:DATA?")
     if fmt == "WORD":
-        raw = np.frombuffer(payload, dtype=">i2")
+        raw = np.frombuffer(payload, dtype="<i2")
     else:
         raw = np.frombuffer(payload, dtype=np.uint8)
 
-    v = (raw - yref) * yinc + yorg
-    n = len(v)
-    t = (np.arange(n) - xref) * xinc + xorg
+    # Rå ADC-koder gemmes; volt = (raw - y_reference) * y_increment + y_origin
+    # og tidsaksen genskabes som (arange(n) - x_reference) * x_increment + x_origin
+    n = len(raw)
     fs = 1.0 / xinc if xinc > 0 else None
 
-    return t, v, {
+    return raw, {
         "x_increment": xinc,
         "x_origin": xorg,
         "x_reference": xref,
@@ -118,6 +206,146 @@ def read_waveform(scope, channel_cfg, acq_cfg):
     }
 
 
+def filter_kwargs(store_cfg):
+    """Kompressions-kwargs til create_dataset ud fra store-config."""
+    kwargs = {}
+    compress = store_cfg.get("compress", "none")
+    if compress == "gzip":
+        kwargs["compression"] = "gzip"
+        kwargs["compression_opts"] = 4
+    elif compress == "lzf":
+        # LZF følger med h5py; shuffle samler bytes af samme betydning
+        kwargs["compression"] = "lzf"
+        kwargs["shuffle"] = True
+    elif compress == "blosc":
+        if hdf5plugin is None:
+            raise RuntimeError("compress='blosc' kræver pakken hdf5plugin.")
+        kwargs.update(hdf5plugin.Blosc(cname="lz4", clevel=5,
+                                       shuffle=hdf5plugin.Blosc.SHUFFLE))
+    elif compress == "bitshuffle":
+        if hdf5plugin is None:
+            raise RuntimeError("compress='bitshuffle' kræver pakken hdf5plugin.")
+        kwargs.update(hdf5plugin.Bitshuffle(cname="lz4"))
+    return kwargs
+
+
+def create_dataset(grp, name, data, store_cfg):
+    """
+    Opretter dataset efter store-config ("compress": none/gzip/lzf/blosc/
+    bitshuffle, "chunk": bool). Chunk-længden vælges så hver chunk fylder ca. CHUNK_BYTES.
+    """
+    # Ingen ændringstider pr. objekt: færre metadata-opdateringer
+    kwargs = dict(filter_kwargs(store_cfg), track_times=False)
+    compress = store_cfg.get("compress", "none")
+
+    if len(data) and (store_cfg.get("chunk", False) or compress != "none"):
+        itemsize = np.dtype(getattr(data, "dtype", "float64")).itemsize
+        kwargs["chunks"] = (max(1, min(len(data), CHUNK_BYTES // itemsize)),)
+
+    if compress == "gzip" and "chunks" in kwargs:
+        # Komprimeres med zlib (slipper GIL'en) og skrives direkte som
+        # færdige chunks uden om HDF5's filter-pipeline
+        dset = grp.create_dataset(name, shape=data.shape, dtype=data.dtype, **kwargs)
+        write_chunks_direct(dset, data, kwargs["compression_opts"])
+        return dset
+
+    return grp.create_dataset(name, data=data, **kwargs)
+
+
+def write_chunks_direct(dset, data, level, row=None):
+    """
+    Skriver 1D data til et gzip-chunked dataset via write_direct_chunk
+    (med row: til række row i et 2D dataset chunket som (1, n)).
+    Deflate-filteret i HDF5 bruger zlib-formatet, så zlib.compress giver
+    samme bytes som filteret ville. Sidste chunk paddes til fuld længde.
+    """
+    data = np.ascontiguousarray(data)
+    n_chunk = dset.chunks[-1]
+    for start in range(0, len(data), n_chunk):
+        block = data[start:start + n_chunk]
+        if len(block) < n_chunk:
+            pad = np.zeros(n_chunk, dtype=data.dtype)
+            pad[:len(block)] = block
+            block = pad
+        offset = (start,) if row is None else (row, start)
+        dset.id.write_direct_chunk(offset, zlib.compress(block, level))
+
+
+def write_channel(sweep, alias, raw, meta, store_cfg, raw_fp=None):
+    """
+    Skriver én kanals rå data + metadata til sweep-gruppen.
+    Med raw_fp (store.external_raw) lægges bytes sammenhængende i .raw-filen
+    med tofile(), og voltage_raw bliver et externt dataset der peger på dem.
+    """
+    grp = sweep.create_group(alias)
+    if raw_fp is None:
+        create_dataset(grp, "voltage_raw", raw, store_cfg)
+    else:
+        offset = raw_fp.tell()
+        raw.tofile(raw_fp)
+        grp.create_dataset("voltage_raw", shape=raw.shape, dtype=raw.dtype, track_times=False,
+                           external=[(os.path.basename(raw_fp.name), offset, raw.nbytes)])
+
+    for k, val in meta.items():
+        grp.attrs[k] = val
+
+
+def next_prime(n):
+    """Mindste primtal >= n (rdcc_nslots bør være et primtal)."""
+    n = max(2, n)
+    while any(n % d == 0 for d in range(2, int(n ** 0.5) + 1)):
+        n += 1
+    return n
+
+
+def h5_cache_2d(n, rows, cols, itemsize):
+    """
+    Chunk-cache til et (samples, n) dataset chunket som (rows, cols): plads
+    til hele rækken af chunks som en sweep skriver i (+1 chunk), og mindst
+    10 hash-slots pr. chunk så de ikke kolliderer og smides ud før tid.
+    """
+    row_chunks = -(-n // cols)
+    chunk_bytes = rows * cols * itemsize
+    return {"rdcc_nbytes": (row_chunks + 1) * chunk_bytes,
+            "rdcc_nslots": next_prime(10 * row_chunks)}
+
+
+def create_channel_dataset(chan_grp, alias, samples, raw, meta, store_cfg):
+    """
+    layout="channels": ét 2D dataset (samples, punkter) pr. kanal, én række
+    pr. sweep. Oprettes ved første sweep, hvor punktantallet kendes.
+    Skalering/tidsbase gemmes én gang som attributter på kanalgruppen.
+    """
+    grp = chan_grp.create_group(alias)
+    n = len(raw)
+    itemsize = raw.dtype.itemsize
+    cols = max(1, min(n, CHUNK_COLS))
+    row_bytes = -(-n // cols) * cols * itemsize  # én sweep hen over alle chunks
+    rows = max(1, min(samples, CHUNK_BYTES // (cols * itemsize), ROW_CACHE_BYTES // row_bytes))
+    dset = grp.create_dataset("raw", shape=(samples, n), dtype=raw.dtype,
+                              chunks=(rows, cols), track_times=False,
+                              **h5_cache_2d(n, rows, cols, itemsize),
+                              **filter_kwargs(store_cfg))
+    # Ingen tidsakse gemmes: t = (sample - x_reference) * x_increment + x_origin
+    dset.dims[0].label = "sweep"
+    dset.dims[1].label = "sample"
+    for k, val in meta.items():
+        grp.attrs[k] = val
+    return dset
+
+
+def write_channel_row(dset, i, raw, store_cfg):
+    """Skriver én sweeps rå data som række i i kanalens 2D dataset."""
+    if len(raw) != dset.shape[1]:
+        raise ValueError(f"{dset.name}: sweep {i} har {len(raw)} punkter, "
+                         f"forventede {dset.shape[1]}")
+    if store_cfg.get("compress", "none") == "gzip" and dset.chunks[0] == 1:
+        # Kun chunks på én række kan skrives færdige; ellers samler cachen dem
+        write_chunks_direct(dset, raw, dset.compression_opts, row=i)
+    else:
+        dset[i, :] = raw
+
+
 def timestamped_path(base, ts_local):
     root, ext = os.path.splitext(base)
     dt = datetime.fromisoformat(ts_local)
@@ -130,7 +358,18 @@ def acquire_loop(config):
     acq_cfg = config["acquisition"]
     channels = [c for c in config["channels"] if c.get("enabled", True)]
 
+    by_channel = store_cfg.get("layout", "sweeps") == "channels"
+    external = store_cfg.get("external_raw", False)
+    if external and (by_channel or store_cfg.get("compress", "none") != "none"):
+        raise ValueError("store.external_raw kræver layout='sweeps' og compress='none'.")
+    # SWMR kræver at alle objekter findes før skrivningen starter -> kun layout "channels"
+    swmr = store_cfg.get("swmr", False)
+    if swmr and not by_channel:
+        raise ValueError("store.swmr kræver layout='channels'.")
+    flush_every = int(store_cfg.get("flush_every", 16))
+
     scope = open_scope_with_autodetect(config)
+    invalidate_preamble_cache()
 
     ts_local, ts_utc = now_pair()
     out_path = store_cfg["output_file"]
@@ -138,41 +377,102 @@ def acquire_loop(config):
     if store_cfg.get("timestamped", True):
         out_path = timestamped_path(out_path, ts_local)
 
-    with h5py.File(out_path, "w") as h5f:
+    # external_raw: rå data i <navn>.raw ved siden af .h5-filen (ren tofile),
+    # .h5 rummer kun struktur, metadata og referencer ind i .raw-filen
+    raw_path = os.path.splitext(out_path)[0] + ".raw"
+
+    # HDF5-skrivning kører i én baggrundstråd, så scopet kan overføre næste
+    # kanal imens. Scope-forbindelsen bruges kun fra hovedtråden og lukkes til sidst.
+    with closing(scope), h5py.File(out_path, "w", libver=H5_LIBVER, track_order=False,
+                                   **H5_CACHE) as h5f, \
+            (open(raw_path, "wb") if external else nullcontext()) as raw_fp, \
+            ThreadPoolExecutor(max_workers=1) as writer:
 
         meta_grp = h5f.create_group("metadata")
         meta_grp.attrs["created_local"] = ts_local
         meta_grp.attrs["created_utc"] = ts_utc
-        meta_grp.attrs["scope_idn"] = Q(scope, "*IDN?").strip()
-
-        sweeps_grp = h5f.create_group("sweeps")
+        meta_grp.attrs["scope_idn"] = scope.idn().strip()
 
         samples = int(acq_cfg["samples"])
         interval = float(acq_cfg["interval_sec"])
 
+        # layout "sweeps": sweeps/sweep_XXX/<alias>/voltage_raw (én gruppe pr. sweep)
+        # layout "channels": channels/<alias>/raw som 2D (samples, punkter)
+        if by_channel:
+            chan_grp = h5f.create_group("channels")
+            sweeps_meta = h5f.create_dataset("sweeps_meta", (samples,), dtype=SWEEP_META_DTYPE,
+                                             track_times=False)
+            chan_ds = {}
+        else:
+            sweeps_grp = h5f.create_group("sweeps")
+
+        pending = None
         for i in range(samples):
-            ts_local, ts_utc = now_pair()
-            sweep = sweeps_grp.create_group(f"sweep_{i:03d}")
-            sweep.attrs["timestamp_local"] = ts_local
-            sweep.attrs["timestamp_utc"] = ts_utc
-
+            if by_channel:
+                # Ét 8-byte felt pr. sweep; ingen strengformatering i løkken
+                ts_ns = time.time_ns()
+                sweeps_meta[i] = (ts_ns,)
+            else:
+                ts_local, ts_utc = now_pair()
+                sweep = sweeps_grp.create_group(f"sweep_{i:03d}")
+                sweep.attrs["timestamp_local"] = ts_local
+                sweep.attrs["timestamp_utc"] = ts_utc
+
+            # Alle kanaler optages i én :DIGITIZE; derefter hentes de én ad gangen,
+            # mens forrige kanal skrives i baggrundstråden
+            digitize(scope, channels)
             for ch in channels:
                 alias = ch["name"]
-                t, v, meta = read_waveform(scope, ch, acq_cfg)
+                raw, meta = read_waveform(scope, ch, acq_cfg, acquire=False)
+                log.debug("Kanal %s (%s): %d punkter", alias, ch["source"], len(raw))
+
+                if pending is not None:
+                    pending.result()
+                if not by_channel:
+                    pending = writer.submit(write_channel, sweep, alias, raw, meta,
+                                            store_cfg, raw_fp)
+                    continue
+                if alias not in chan_ds:
+                    chan_ds[alias] = create_channel_dataset(chan_grp, alias, samples,
+                                                            raw, meta, store_cfg)
+                pending = writer.submit(write_channel_row, chan_ds[alias], i, raw, store_cfg)
+
+            log.info("Sweep %d/%d", i + 1, samples)
+
+            # Efter første sweep findes alle datasæt; herefter kan læsere (fx
+            # API-serveren) åbne filen med swmr=True og følge med undervejs
+            if swmr and i == 0:
+                pending.result()
+                h5f.swmr_mode = True
+            # Periodisk flush: et nedbrud mister højst flush_every sweeps,
+            # uden at betale flush-omkostningen for hver skrivning
+            if flush_every and (i + 1) % flush_every == 0:
+                pending.result()
+                h5f.flush()
 
-                grp = sweep.create_group(alias)
-                grp.create_dataset("time", data=t)
-                grp.create_dataset("voltage", data=v)
+            if i < samples - 1:
+                time.sleep(interval)
 
-                for k, val in meta.items():
-                    grp.attrs[k] = val
+        if pending is not None:
+            pending.result()
 
-            print(f"[{ts_local}] Sweep {i+1}/{samples}")
+    log.info("Gemte data i: %s", out_path)
 
-            if i < samples - 1:
-                time.sleep(interval)
 
-    print(f"Gemte data i: {out_path}")
+def start_logging(debug=False):
+    """
+    Log-poster lægges i en kø og skrives af en QueueListener-tråd, så
+    opsamlingsløkken aldrig venter på stdout. Returnerer listeneren (stop() til sidst).
+    """
+    q = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s"))
+    listener = logging.handlers.QueueListener(q, handler)
+    log.addHandler(logging.handlers.QueueHandler(q))
+    log.setLevel(logging.DEBUG if debug else logging.INFO)
+    log.propagate = False
+    listener.start()
+    return listener
 
 
 def main():
@@ -183,11 +483,14 @@ def main():
     args = parser.parse_args()
 
     DEBUG = args.debug
+    listener = start_logging(DEBUG)
 
-    with open(args.config, "r") as f:
-        cfg = json.load(f)
+    cfg = config_loader.load(args.config)
 
-    acquire_loop(cfg)
+    try:
+        acquire_loop(cfg)
+    finally:
+        listener.stop()
 
 
 if __name__ == "__main__":
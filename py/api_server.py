@@ -8,29 +8,71 @@ Provides REST API endpoints for:
 - Configuration management
 - Test control
 
-Run with: uvicorn api_server:app --reload --host 0.0.0.0 --port 8000
+Run with: python api_server.py [--reload]
 """
 
-import json
 import asyncio
+import functools
+import os
+from contextlib import asynccontextmanager, suppress
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from fastapi import FastAPI, HTTPException
+import numpy as np
+import orjson
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 
+import config_loader
 # Import our hardware discovery functions
-from hardware_discovery import discover_hardware
+from hardware_discovery import discover_hardware, extract_firmware_version
+from hardware_utils import _VIDPID_MAP
 from omron_temp_poll import E5CCTool
 from rs510_vfd_control import RS510VFDController, VFDCommand, VFDState
+from shared_modbus_manager import reset_shared_modbus_manager
+
+class OrjsonResponse(JSONResponse):
+    """JSON response rendered with orjson instead of the stdlib encoder."""
+
+    def render(self, content) -> bytes:
+        # NumPy arrays are written straight from their buffers
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Run the hardware scanner and telemetry producer for the lifetime of the
+    server, and close the pooled device handles on shutdown.
+    """
+    global _scanner_task, _scan_now, _scan_done
+
+    _scan_now = asyncio.Event()
+    _scan_done = asyncio.Condition()
+    _scanner_task = asyncio.create_task(_hardware_scanner())
+    telemetry_task = asyncio.create_task(_telemetry_producer())
+    try:
+        yield
+    finally:
+        for task in (telemetry_task, _scanner_task):
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        _scanner_task = None
+        async with _scope_lock:
+            await run_blocking(close_hardware_sessions)
 
 app = FastAPI(
     title="Test Rig API",
     description="Backend API for Test Rig Instrumentation Dashboard",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=OrjsonResponse,
+    lifespan=lifespan
 )
 
 # Enable CORS for React frontend
@@ -51,6 +93,8 @@ class HardwareStatus(BaseModel):
     ports: Dict
 
 class RP2040Command(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     command: str
     port: Optional[str] = None
 
@@ -62,16 +106,36 @@ class TestConfig(BaseModel):
     acquisition: Dict
 
 class OmronCommand(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     action: str  # 'read_pv', 'read_sv', 'write_sv'
     value: Optional[float] = None  # For write_sv
     port: Optional[str] = None
 
 class VFDCommand(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     action: str  # 'status', 'start_forward', 'start_reverse', 'stop', 'emergency_stop', 'set_frequency'
     frequency_hz: Optional[float] = None  # For set_frequency and start commands
     port: Optional[str] = None
     slave_id: Optional[int] = 1
 
+class PortInfo(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+    device: str
+    description: Optional[str] = None
+    hwid: Optional[str] = None
+    vid: Optional[str] = None
+    pid: Optional[str] = None
+    serial_number: Optional[str] = None
+    manufacturer: Optional[str] = None
+    product: Optional[str] = None
+    device_type: Optional[str] = None
+
+# Serializes a port list in pydantic-core, without FastAPI's jsonable_encoder
+_PORTS_ADAPTER = TypeAdapter(List[PortInfo])
+
 class VFDStatusResponse(BaseModel):
     frequency_hz: float
     frequency_command_hz: float
@@ -86,11 +150,397 @@ class VFDStatusResponse(BaseModel):
     timestamp: str
 
 # --- Global State ---
+CONFIG_PATH = Path(__file__).parent / "config.json"
+
 _last_hardware_scan = None
 _hardware_cache_duration = 30  # seconds
 
-# Global lock for oscilloscope access to prevent concurrent SCPI commands
-_scope_lock = threading.Lock()
+# Serializes synchronous scans so a cold cache triggers only one discovery
+_hardware_scan_lock = threading.Lock()
+
+# Background scanner: refreshes _last_hardware_scan every
+# _hardware_scan_interval seconds, or at once when _scan_now is set
+_hardware_scan_interval = 20  # seconds
+_scanner_task = None
+_scan_now = None
+_scan_done = None      # asyncio.Condition, notified after every scan
+# Scans the scanner has started / finished; request_hardware_scan() waits
+# for the first scan that started after the request
+_scans_started = 0
+_scans_finished = 0
+
+# Global lock for oscilloscope access to prevent concurrent SCPI commands.
+# Waiters queue on the event loop instead of parking I/O pool threads.
+_scope_lock = asyncio.Lock()
+
+# Long-lived device sessions, reused across requests instead of reopening
+# the port (and re-probing the device) on every call
+_serial_pool = {}          # port -> open serial.Serial (RP2040)
+_serial_locks = {}         # port -> threading.Lock guarding that port
+_serial_pool_lock = threading.Lock()
+_omron_tool = None         # E5CCTool, created on first use
+_vfd_controllers = {}      # (port, slave_id) -> RS510VFDController
+# Omron and VFD share one RS485 bus (single master): one transaction at a time
+_rs485_lock = threading.Lock()
+_scope_rm = None           # pyvisa ResourceManager, created on first use
+_scope_res = None          # open VISA session to the scope (guarded by _scope_lock)
+_scope_ip = None
+
+# /ws/telemetry: one producer reads the devices and pushes to every subscriber
+_telemetry_clients = set()
+_telemetry_last = None     # last message sent, replayed to new subscribers
+_telemetry_interval = 0.25  # seconds
+_telemetry_send_timeout = 1.0  # seconds; a client slower than this is dropped
+
+# Last comports() enumeration, shared by discovery and /api/system/ports and
+# reused for _hardware_cache_duration seconds: (monotonic time, ports, json)
+_comports_cache = (float('-inf'), [], None)
+
+# Blocking serial/Modbus/VISA/discovery work runs here so the event loop keeps
+# serving other requests during a device round-trip
+_tpe = ThreadPoolExecutor(max_workers=8, thread_name_prefix="api-io")
+
+# Most points the dashboard preview plots
+MAX_WEB_POINTS = 2000
+
+# Field types of the Keysight :WAV:PRE? reply, in order:
+# format (0=BYTE, 1=WORD, 4=ASCII), type (0=NORMAL, 1=PEAK, 2=AVERAGE), points,
+# count, x_increment (s), x_origin (s), x_reference (sample), y_increment (V/LSB),
+# y_origin (V), y_reference (code)
+_PRE_TYPES = (int, int, int, int, float, float, int, float, float, int)
+
+# --- Helpers ---
+
+async def run_blocking(fn, *args):
+    """Run a blocking function on the I/O pool and await its result."""
+    return await asyncio.get_running_loop().run_in_executor(_tpe, fn, *args)
+
+def load_config():
+    """
+    Parsed config.json, or None if it does not exist. The file is only
+    re-read when its mtime or size changes, so a call costs one stat();
+    treat the returned dict as read-only.
+    """
+    try:
+        return config_loader.load(CONFIG_PATH)
+    except FileNotFoundError:
+        return None
+
+def _scan_is_fresh(scan, max_age):
+    return scan is not None and (_scanner_task is not None or
+                                 (datetime.now() - scan['timestamp']).total_seconds() < max_age)
+
+def _get_snapshot(force=False, max_age=None):
+    """
+    The discovery snapshot dict behind get_hardware_cached. The module global
+    can be cleared at any time (invalidate_hardware_cache), so callers that
+    need more than one field use the dict returned here instead of re-reading it.
+    """
+    if max_age is None:
+        max_age = _hardware_cache_duration
+    scan = _last_hardware_scan
+    if not force and _scan_is_fresh(scan, max_age):
+        return scan
+    with _hardware_scan_lock:
+        # Another thread may have finished a scan while we waited for the lock
+        latest = _last_hardware_scan
+        if latest is not scan and _scan_is_fresh(latest, max_age):
+            return latest
+        return _scan_snapshot()
+
+def get_hardware_cached(force=False, max_age=None):
+    """
+    Return the latest discovery result. While the background scanner runs
+    this is just the last snapshot; otherwise rescan once it is older than
+    max_age (default _hardware_cache_duration) or when force is set.
+    Concurrent callers on a stale cache wait for one shared scan.
+    """
+    return _get_snapshot(force, max_age)['data']
+
+def _scan_snapshot():
+    global _last_hardware_scan
+
+    hardware_info = discover_hardware(load_config(), ports=enumerate_comports(),
+                                      rp2040_probe=probe_rp2040)
+    scan = _last_hardware_scan = {
+        'timestamp': datetime.now(),
+        'data': hardware_info,
+        'json': None
+    }
+    return scan
+
+def scan_hardware():
+    """Run hardware discovery and store the result as the current snapshot."""
+    return _scan_snapshot()['data']
+
+async def _hardware_scanner():
+    """Refresh the hardware snapshot periodically, or when a scan is requested."""
+    global _scans_started, _scans_finished
+
+    while True:
+        _scans_started += 1
+        try:
+            # Under the scan lock, so a request arriving before the first
+            # snapshot waits for this scan instead of starting its own
+            await run_blocking(functools.partial(get_hardware_cached, force=True))
+        except Exception as e:
+            print(f"Background hardware scan failed: {e}")
+        async with _scan_done:
+            _scans_finished = _scans_started
+            _scan_done.notify_all()
+        try:
+            await asyncio.wait_for(_scan_now.wait(), timeout=_hardware_scan_interval)
+        except asyncio.TimeoutError:
+            pass
+        _scan_now.clear()
+
+async def request_hardware_scan():
+    """
+    Ask the background scanner for a fresh scan and wait until it finishes.
+    A scan already running when this is called started before the request
+    and may have missed a change, so wait for the one after it.
+    """
+    wanted = _scans_started + 1
+    _scan_now.set()
+    async with _scan_done:
+        await _scan_done.wait_for(lambda: _scans_finished >= wanted)
+
+def invalidate_hardware_cache():
+    """
+    Mark the discovery snapshot stale after a port disappeared or could not
+    be opened, so the next lookup sees a fresh scan instead of waiting out
+    the TTL. Safe to call from worker threads.
+    """
+    global _last_hardware_scan
+
+    if _scanner_task is not None:
+        _scanner_task.get_loop().call_soon_threadsafe(_scan_now.set)
+    else:
+        _last_hardware_scan = None
+
+def invalidate_if_port_gone(port):
+    """
+    Rescan only if port has left the serial port listing. A device that
+    times out on a port that is still present (e.g. an Omron at the 4 Hz
+    telemetry rate) would otherwise keep the full discovery running back
+    to back.
+    """
+    if all(p.device != port for p in enumerate_comports()):
+        invalidate_hardware_cache()
+
+def enumerate_comports():
+    """Enumerate serial ports (blocking) and make them the shared listing."""
+    global _comports_cache
+    import serial.tools.list_ports
+
+    ports = serial.tools.list_ports.comports()
+    _comports_cache = (time.monotonic(), ports, None)
+    return ports
+
+def get_hardware_json():
+    """Cached discovery result as JSON bytes, serialized once per scan."""
+    scan = _get_snapshot()
+    if scan['json'] is None:
+        scan['json'] = orjson.dumps(scan['data'])
+    return scan['json']
+
+def get_serial_port(port, rescan=True):
+    """
+    Return (serial.Serial, lock) for an RP2040 port, opening it on first use.
+    rescan=False: do not request a rescan if the port cannot be opened.
+    """
+    import serial
+
+    with _serial_pool_lock:
+        lock = _serial_locks.setdefault(port, threading.Lock())
+        ser = _serial_pool.get(port)
+        if ser is None or not ser.is_open:
+            try:
+                ser = _serial_pool[port] = serial.Serial(port, 115200, timeout=2.0)
+            except serial.SerialException:
+                # The snapshot listed a port that is gone; rescan
+                if rescan:
+                    invalidate_hardware_cache()
+                raise
+    return ser, lock
+
+def serial_txrx(ser, *commands):
+    """
+    Send one or more command lines in a single write and return the reply
+    line (or a list of lines, one per command). read_until() returns as soon
+    as the newline arrives. A reply that does not arrive within the port
+    timeout raises SerialTimeoutException: a late line would otherwise be
+    taken as the answer to the next command.
+    """
+    ser.write(''.join(f'{c}\r\n' for c in commands).encode())
+    replies = []
+    for command in commands:
+        line = ser.read_until(b'\n', size=256)
+        if not line.endswith(b'\n'):
+            import serial
+            raise serial.SerialTimeoutException(f"No reply to {command!r}")
+        replies.append(line.decode('ascii', errors='ignore').strip())
+    return replies[0] if len(commands) == 1 else replies
+
+def drop_serial_port(port, rescan=True):
+    """Close and forget a pooled port after an error so the next request reopens it."""
+    with _serial_pool_lock:
+        ser = _serial_pool.pop(port, None)
+    if ser is not None:
+        try:
+            ser.close()
+        except Exception:
+            pass
+    if rescan:
+        invalidate_if_port_gone(port)
+
+def probe_rp2040(port):
+    """
+    Discovery probe for the RP2040 (same result as
+    hardware_discovery.test_rp2040_connection), run over the pooled handle
+    while holding its lock. A second handle on the tty would steal reply
+    lines from the requests using the pool, and cannot be opened at all on
+    Windows. A failing probe does not request another scan: the probe runs
+    inside one.
+    """
+    try:
+        ser, lock = get_serial_port(port, rescan=False)
+        with lock:
+            try:
+                ser.reset_input_buffer()
+                response, info_response = serial_txrx(ser, 'PING', 'INFO')
+            except Exception:
+                drop_serial_port(port, rescan=False)
+                raise
+    except Exception as e:
+        return {
+            'status': 'error',
+            'error': str(e),
+            'last_attempt': datetime.now().isoformat()
+        }
+    
+    if not response.startswith('OK PONG'):
+        return {
+            'status': 'error',
+            'error': f'Unexpected response: {response}',
+            'last_ping': datetime.now().isoformat()
+        }
+    return {
+        'status': 'connected',
+        'ping_response': response,
+        'info_response': info_response,
+        'firmware_version': extract_firmware_version(info_response),
+        'last_ping': datetime.now().isoformat()
+    }
+
+def get_omron_tool(port):
+    """Return the shared E5CCTool, creating it on first use or when the port changed."""
+    global _omron_tool
+
+    if _omron_tool is None or _omron_tool.modbus_config.port != port:
+        # Using shared modbus-compatible settings
+        # Note: Both E5CC and VFD will use shared modbus connection
+        _omron_tool = E5CCTool(
+            port=port,
+            baudrate=9600,    # Standardized baudrate for shared connection
+            parity='N',       # Standardized parity for shared connection
+            bytesize=8,
+            stopbits=1,
+            timeout=2.0,      # Increased timeout for shared connection
+            unit_id=2,        # E5CC unit ID
+            pv_address=0x2000,
+            sv_address=0x2103,
+            scale=1.0,
+            debug=False
+        )
+    return _omron_tool
+
+def reset_omron_tool(port):
+    """Drop the shared E5CCTool after an error so the next request recreates it."""
+    global _omron_tool
+
+    if _omron_tool is not None:
+        _omron_tool.close()
+        _omron_tool = None
+    invalidate_if_port_gone(port)
+
+def get_vfd_controller(port, slave_id):
+    """Return the RS510VFDController for (port, slave_id), creating it on first use."""
+    vfd = _vfd_controllers.get((port, slave_id))
+    if vfd is None:
+        vfd = _vfd_controllers[(port, slave_id)] = RS510VFDController(
+            port=port,
+            slave_id=slave_id,
+            baudrate=9600,  # Standard VFD baud rate
+            timeout=2.0,
+            debug=False
+        )
+    return vfd
+
+def reset_vfd_controller(port):
+    """Drop the VFD controllers after an error so the next request recreates them."""
+    _vfd_controllers.clear()
+    invalidate_if_port_gone(port)
+
+def get_scope_resource(scope_ip):
+    """Return the shared VISA session to the scope, opening it on first use or when the IP changed."""
+    global _scope_rm, _scope_res, _scope_ip
+
+    if _scope_res is None or _scope_ip != scope_ip:
+        import pyvisa
+
+        reset_scope_resource()
+        if _scope_rm is None:
+            _scope_rm = pyvisa.ResourceManager('@py')
+        scope = _scope_rm.open_resource(f'TCPIP::{scope_ip}::INSTR')
+        scope.timeout = 15000  # Increased timeout for dashboard preview
+        scope.write_termination = '\n'
+        scope.read_termination = '\n'
+        # No Nagle delay on the short SCPI commands. Backends that do not
+        # support the attribute on INSTR sessions (pyvisa-py) refuse it
+        with suppress(Exception):
+            scope.set_visa_attribute(pyvisa.constants.VI_ATTR_TCPIP_NODELAY, True)
+        _scope_res, _scope_ip = scope, scope_ip
+    return _scope_res
+
+def reset_scope_resource():
+    """Close the shared scope session after an error so the next request reconnects."""
+    global _scope_res, _scope_ip
+
+    if _scope_res is not None:
+        try:
+            _scope_res.close()
+        except Exception:
+            pass
+        _scope_res = _scope_ip = None
+
+def close_hardware_sessions():
+    """Close every pooled serial port, the Modbus connection and the scope session."""
+    global _omron_tool, _scope_rm
+
+    with _serial_pool_lock:
+        pooled = list(_serial_pool.items())
+        _serial_pool.clear()
+    for port, ser in pooled:
+        # Wait for a transaction in progress on this port to finish
+        with _serial_locks[port]:
+            try:
+                ser.close()
+            except Exception:
+                pass
+
+    with _rs485_lock:
+        _omron_tool = None
+        _vfd_controllers.clear()
+        reset_shared_modbus_manager()
+
+    reset_scope_resource()
+    if _scope_rm is not None:
+        try:
+            _scope_rm.close()
+        except Exception:
+            pass
+        _scope_rm = None
 
 # --- API Endpoints ---
 
@@ -104,7 +554,8 @@ async def root():
             "hardware": "/api/hardware/discover",
             "rp2040": "/api/rp2040/command",
             "config": "/api/config",
-            "health": "/api/health"
+            "health": "/api/health",
+            "telemetry": "/ws/telemetry"
         }
     }
 
@@ -125,32 +576,20 @@ async def discover_hardware_api(force_scan: bool = False):
     Args:
         force_scan: If True, force a new scan instead of using cache
     """
-    global _last_hardware_scan
-    
     try:
-        # Use cached results if recent and not forcing scan
-        if (not force_scan and 
-            _last_hardware_scan and 
-            (datetime.now() - _last_hardware_scan['timestamp']).total_seconds() < _hardware_cache_duration):
-            return _last_hardware_scan['data']
-        
-        # Load config if available
-        config = None
-        config_path = Path(__file__).parent / "config.json"
-        if config_path.exists():
-            with open(config_path) as f:
-                config = json.load(f)
-        
-        # Run hardware discovery
-        hardware_info = discover_hardware(config)
-        
-        # Cache the results
-        _last_hardware_scan = {
-            'timestamp': datetime.now(),
-            'data': hardware_info
-        }
-        
-        return hardware_info
+        # Normally the background scanner's latest snapshot is returned as is
+        if force_scan:
+            if _scanner_task is not None:
+                await request_hardware_scan()
+            else:
+                await run_blocking(functools.partial(get_hardware_cached, force=True))
+        # With the scanner running a snapshot is always current: serve it
+        # straight from the event loop (serialized at most once per scan)
+        if _scanner_task is not None and _last_hardware_scan is not None:
+            content = get_hardware_json()
+        else:
+            content = await run_blocking(get_hardware_json)
+        return Response(content=content, media_type="application/json")
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Hardware discovery failed: {str(e)}")
@@ -162,25 +601,28 @@ async def send_rp2040_command(command: RP2040Command):
     
     Supports commands: PING, INFO, LOAD?, SPEED?, TARE, etc.
     """
+    return await run_blocking(_do_rp2040_command, command)
+
+def _do_rp2040_command(command: RP2040Command):
     try:
-        import serial
-        import time
-        
         # Find RP2040 port if not specified
         port = command.port
         if not port:
-            hardware_info = discover_hardware()
+            hardware_info = get_hardware_cached()
             rp2040_ports = hardware_info.get('ports', {}).get('rp2040', [])
             if not rp2040_ports:
                 raise HTTPException(status_code=404, detail="No RP2040 device found")
             port = rp2040_ports[0]['device']
         
-        # Send command
-        with serial.Serial(port, 115200, timeout=2.0) as ser:
-            ser.write(f'{command.command}\r\n'.encode())
-            time.sleep(0.1)
-            
-            response = ser.readline().decode('ascii', errors='ignore').strip()
+        # Send command over the pooled port
+        ser, lock = get_serial_port(port)
+        with lock:
+            try:
+                ser.reset_input_buffer()
+                response = serial_txrx(ser, command.command)
+            except Exception:
+                drop_serial_port(port)
+                raise
             
             return {
                 "command": command.command,
@@ -196,9 +638,14 @@ async def send_rp2040_command(command: RP2040Command):
 @app.get("/api/rp2040/status")
 async def get_rp2040_status():
     """Get detailed RP2040 status including sensor readings."""
+    # Polled by the dashboard: return the response directly so FastAPI
+    # skips its jsonable_encoder pass over the dict
+    return OrjsonResponse(await run_blocking(_do_rp2040_status))
+
+def _do_rp2040_status():
     try:
         # Get basic hardware info first
-        hardware_info = discover_hardware()
+        hardware_info = get_hardware_cached()
         rp2040_info = hardware_info.get('rp2040', {})
         
         if rp2040_info.get('status') != 'connected':
@@ -209,19 +656,14 @@ async def get_rp2040_status():
         if not port:
             raise HTTPException(status_code=404, detail="RP2040 port not found")
         
-        import serial
-        import time
-        
-        with serial.Serial(port, 115200, timeout=2.0) as ser:
-            # Get load reading
-            ser.write(b'LOAD?\r\n')
-            time.sleep(0.1)
-            load_response = ser.readline().decode('ascii', errors='ignore').strip()
-            
-            # Get speed reading
-            ser.write(b'SPEED?\r\n')
-            time.sleep(0.1)
-            speed_response = ser.readline().decode('ascii', errors='ignore').strip()
+        ser, lock = get_serial_port(port)
+        with lock:
+            try:
+                ser.reset_input_buffer()
+                load_response, speed_response = serial_txrx(ser, 'LOAD?', 'SPEED?')
+            except Exception:
+                drop_serial_port(port)
+                raise
             
             return {
                 **rp2040_info,
@@ -233,67 +675,170 @@ async def get_rp2040_status():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"RP2040 status check failed: {str(e)}")
 
+# --- Telemetry push ---
+
+def _read_telemetry():
+    """One reading of the Omron and RP2040 values pushed on /ws/telemetry."""
+    omron = _do_omron_status()
+    try:
+        rp2040 = _do_rp2040_status()
+    except HTTPException as e:
+        rp2040 = {"status": "error", "error": e.detail}
+    return {
+        "omron": {k: omron[k] for k in ("status", "process_value_c", "setpoint_value_c", "error")
+                  if k in omron},
+        "rp2040": {k: rp2040[k] for k in ("status", "load_reading", "speed_reading", "error")
+                   if k in rp2040},
+    }
+
+async def _send_or_drop(ws: WebSocket, message: str):
+    try:
+        await asyncio.wait_for(ws.send_text(message), timeout=_telemetry_send_timeout)
+    except Exception:
+        # Stalled or gone: stop sending to it, and end its connection
+        _telemetry_clients.discard(ws)
+        with suppress(Exception):
+            await asyncio.wait_for(ws.close(), timeout=_telemetry_send_timeout)
+
+async def _broadcast(message: str):
+    """Send to all subscribers concurrently, so one slow client cannot hold up the rest."""
+    await asyncio.gather(*(_send_or_drop(ws, message) for ws in list(_telemetry_clients)),
+                         return_exceptions=True)
+
+async def _telemetry_producer():
+    """
+    Poll the devices every _telemetry_interval seconds while anyone is
+    subscribed, and push a message only when a reading changed.
+    """
+    global _telemetry_last
+
+    last = None
+    while True:
+        if _telemetry_clients:
+            try:
+                data = await run_blocking(_read_telemetry)
+            except Exception as e:
+                print(f"Telemetry read failed: {e}")
+            else:
+                if data != last:
+                    last = data
+                    now = time.time()
+                    _telemetry_last = orjson.dumps(
+                        {**data, "timestamp": datetime.fromtimestamp(now).isoformat(),
+                         "unix_ms": int(now * 1000)}).decode()
+                    await _broadcast(_telemetry_last)
+        else:
+            last = _telemetry_last = None
+        await asyncio.sleep(_telemetry_interval)
+
+@app.websocket("/ws/telemetry")
+async def telemetry_ws(websocket: WebSocket):
+    """Push Omron/RP2040 readings as JSON text messages whenever they change."""
+    await websocket.accept()
+    if _telemetry_last is not None:
+        await websocket.send_text(_telemetry_last)
+    _telemetry_clients.add(websocket)
+    try:
+        # Nothing is expected from the client; this only waits for the disconnect
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        _telemetry_clients.discard(websocket)
+
+@functools.lru_cache(maxsize=256)
+def _read_profile_cached(path: str, mtime_ns: int, size: int) -> dict:
+    config_data = orjson.loads(Path(path).read_bytes())
+    name = os.path.basename(path)
+    return {
+        "filename": name,
+        "path": f"/config/{name}",
+        "name": config_data.get("name", os.path.splitext(name)[0]),
+        "description": config_data.get("description", ""),
+        "duration_minutes": config_data.get("duration_minutes", 0)
+    }
+
+def _scan_profiles(config_dir: Path):
+    """
+    Profile summaries for every *.json in config_dir. Like load_config(),
+    a file is only re-parsed when its mtime or size changes, so an
+    unchanged directory costs one scandir plus a stat per file.
+    """
+    profiles = []
+    try:
+        entries = os.scandir(config_dir)
+    except FileNotFoundError:
+        return profiles
+    with entries:
+        for entry in entries:
+            if not entry.name.endswith(".json") or not entry.is_file():
+                continue
+            try:
+                st = entry.stat()
+                profiles.append(_read_profile_cached(entry.path, st.st_mtime_ns, st.st_size))
+            except Exception as e:
+                print(f"Error reading {entry.path}: {e}")
+    return profiles
+
 @app.get("/api/config/profiles")
 async def list_config_profiles():
     """List available test configuration profiles."""
     try:
         config_dir = Path(__file__).parent.parent / "react" / "public" / "config"
-        profiles = []
-        
-        if config_dir.exists():
-            for config_file in config_dir.glob("*.json"):
-                try:
-                    with open(config_file) as f:
-                        config_data = json.load(f)
-                    
-                    profiles.append({
-                        "filename": config_file.name,
-                        "path": f"/config/{config_file.name}",
-                        "name": config_data.get("name", config_file.stem),
-                        "description": config_data.get("description", ""),
-                        "duration_minutes": config_data.get("duration_minutes", 0)
-                    })
-                except Exception as e:
-                    print(f"Error reading {config_file}: {e}")
-                    
-        return {"profiles": profiles}
+        return {"profiles": await run_blocking(_scan_profiles, config_dir)}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list profiles: {str(e)}")
 
+def _ports_json(ports):
+    """Serialize a comports() listing for /api/system/ports."""
+    infos = []
+    for port in ports:
+        port_info = {
+            'device': port.device,
+            'description': port.description,
+            'hwid': port.hwid,
+            'vid': f"{port.vid:04X}" if port.vid else None,
+            'pid': f"{port.pid:04X}" if port.pid else None,
+            'serial_number': port.serial_number,
+            'manufacturer': port.manufacturer,
+            'product': port.product,
+        }
+        
+        # Add device type detection
+        if port.vid and port.pid:
+            hit = _VIDPID_MAP.get((port.vid, port.pid))
+            if hit:
+                port_info['device_type'] = hit[1]
+            elif port.vid == 0x0403:
+                # FTDI chip not listed in DEVICE_IDS
+                port_info['device_type'] = 'FTDI USB-Serial'
+            else:
+                port_info['device_type'] = 'Unknown'
+        
+        infos.append(PortInfo(**port_info))
+    
+    # device_type is left out (unset) for ports without a USB VID/PID
+    return b'{"ports":%s,"count":%d}' % (
+        _PORTS_ADAPTER.dump_json(infos, exclude_unset=True), len(infos))
+
 @app.get("/api/system/ports")
 async def list_system_ports():
     """List all available serial ports on the system."""
+    global _comports_cache
     try:
-        import serial.tools.list_ports
-        
-        ports = []
-        for port in serial.tools.list_ports.comports():
-            port_info = {
-                'device': port.device,
-                'description': port.description,
-                'hwid': port.hwid,
-                'vid': f"{port.vid:04X}" if port.vid else None,
-                'pid': f"{port.pid:04X}" if port.pid else None,
-                'serial_number': port.serial_number,
-                'manufacturer': port.manufacturer,
-                'product': port.product,
-            }
-            
-            # Add device type detection
-            if port.vid and port.pid:
-                if port.vid == 0x2E8A and port.pid == 0x0005:
-                    port_info['device_type'] = 'Raspberry Pi Pico (RP2040)'
-                elif port.vid == 0x2886 and port.pid == 0x8027:
-                    port_info['device_type'] = 'Seeed Studio XIAO RP2040'
-                elif port.vid == 0x0403:
-                    port_info['device_type'] = 'FTDI USB-Serial'
-                else:
-                    port_info['device_type'] = 'Unknown'
-            
-            ports.append(port_info)
-        
-        return {"ports": ports, "count": len(ports)}
+        cache = _comports_cache
+        if time.monotonic() - cache[0] >= _hardware_cache_duration:
+            # comports() walks sysfs/SetupAPI; keep it off the event loop
+            await run_blocking(enumerate_comports)
+            cache = _comports_cache
+        content = cache[2]
+        if content is None:
+            content = _ports_json(cache[1])
+            if _comports_cache is cache:
+                _comports_cache = (cache[0], cache[1], content)
+        return Response(content=content, media_type="application/json")
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list ports: {str(e)}")
@@ -305,71 +850,63 @@ async def send_omron_command(command: OmronCommand):
     
     Actions: read_pv, read_sv, write_sv
     """
+    return await run_blocking(_do_omron_command, command)
+
+def _do_omron_command(command: OmronCommand):
     try:
         # Find FTDI port if not specified
         port = command.port
         if not port:
-            hardware_info = discover_hardware()
+            hardware_info = get_hardware_cached()
             ftdi_ports = hardware_info.get('ports', {}).get('ftdi', [])
             if not ftdi_ports:
                 raise HTTPException(status_code=404, detail="No FTDI device found for RS485")
             port = ftdi_ports[0]['device']
         
-        # Create E5CC tool instance
-        # Using shared modbus-compatible settings
-        # Note: Both E5CC and VFD will use shared modbus connection
-        tool = E5CCTool(
-            port=port,
-            baudrate=9600,    # Standardized baudrate for shared connection
-            parity='N',       # Standardized parity for shared connection
-            bytesize=8,
-            stopbits=1,
-            timeout=2.0,      # Increased timeout for shared connection
-            unit_id=2,        # E5CC unit ID
-            pv_address=0x2000,
-            sv_address=0x2103,
-            scale=1.0,
-            debug=False
-        )
-        
-        try:
-            result = {
-                "action": command.action,
-                "port": port,
-                "timestamp": datetime.now().isoformat(),
-                "success": True
-            }
-            
-            if command.action == "read_pv":
-                pv = tool.read_pv_c()
-                result.update({
-                    "temperature_c": pv,
-                    "type": "process_value"
-                })
-            
-            elif command.action == "read_sv":
-                sv = tool.read_sv_c()
-                result.update({
-                    "temperature_c": sv,
-                    "type": "setpoint_value"
-                })
-            
-            elif command.action == "write_sv":
-                if command.value is None:
-                    raise HTTPException(status_code=400, detail="Value required for write_sv action")
-                tool.write_sv_c(command.value)
-                result.update({
-                    "temperature_c": command.value,
-                    "type": "setpoint_written"
-                })
-            
-            else:
-                raise HTTPException(status_code=400, detail=f"Unknown action: {command.action}")
-            
-            return result
-            
-        finally:
-            tool.close()
+        with _rs485_lock:
+            tool = get_omron_tool(port)
+            try:
+                result = {
+                    "action": command.action,
+                    "port": port,
+                    "timestamp": datetime.now().isoformat(),
+                    "success": True
+                }
+                
+                if command.action == "read_pv":
+                    pv = tool.read_pv_c()
+                    result.update({
+                        "temperature_c": pv,
+                        "type": "process_value"
+                    })
+                
+                elif command.action == "read_sv":
+                    sv = tool.read_sv_c()
+                    result.update({
+                        "temperature_c": sv,
+                        "type": "setpoint_value"
+                    })
+                
+                elif command.action == "write_sv":
+                    if command.value is None:
+                        raise HTTPException(status_code=400, detail="Value required for write_sv action")
+                    tool.write_sv_c(command.value)
+                    result.update({
+                        "temperature_c": command.value,
+                        "type": "setpoint_written"
+                    })
+                
+                else:
+                    raise HTTPException(status_code=400, detail=f"Unknown action: {command.action}")
+                
+                return result
+                
+            except HTTPException:
+                raise
+            except Exception:
+                # Recreate the session on the next request
+                reset_omron_tool(port)
+                raise
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Omron E5CC communication failed: {str(e)}")
@@ -377,9 +914,14 @@ async def send_omron_command(command: OmronCommand):
 @app.get("/api/omron/status")
 async def get_omron_status():
     """Get current Omron E5CC temperature readings (PV and SV)."""
+    # Polled by the dashboard: return the response directly so FastAPI
+    # skips its jsonable_encoder pass over the dict
+    return OrjsonResponse(await run_blocking(_do_omron_status))
+
+def _do_omron_status():
     try:
         # Find FTDI port
-        hardware_info = discover_hardware()
+        hardware_info = get_hardware_cached()
         ftdi_ports = hardware_info.get('ports', {}).get('ftdi', [])
         if not ftdi_ports:
             return {
@@ -389,38 +931,29 @@ async def get_omron_status():
         
         port = ftdi_ports[0]['device']
         
-        # Create E5CC tool with shared modbus settings
-        tool = E5CCTool(
-            port=port,
-            baudrate=9600,    # Standardized baudrate for shared connection
-            parity='N',       # Standardized parity for shared connection
-            bytesize=8,
-            stopbits=1,
-            timeout=2.0,      # Increased timeout for shared connection
-            unit_id=2,        # E5CC unit ID
-            pv_address=0x2000,
-            sv_address=0x2103,
-            scale=1.0,
-            debug=False
-        )
+        with _rs485_lock:
+            tool = get_omron_tool(port)
+            try:
+                # Read both PV and SV in one bus transaction
+                pv, sv = tool.read_pv_sv_c()
+            except Exception:
+                # Recreate the session on the next request
+                reset_omron_tool(port)
+                raise
         
-        try:
-            # Read both PV and SV
-            pv = tool.read_pv_c()
-            sv = tool.read_sv_c()
-            
-            return {
-                "status": "connected",
-                "port": port,
-                "timestamp": datetime.now().isoformat(),
-                "process_value_c": pv,
-                "setpoint_value_c": sv,
-                "unit_id": 4,
-                "last_read": datetime.now().isoformat()
-            }
-            
-        finally:
-            tool.close()
+        # One clock read per response; unix_ms for clients that want a number
+        now = time.time()
+        ts = datetime.fromtimestamp(now).isoformat()
+        return {
+            "status": "connected",
+            "port": port,
+            "timestamp": ts,
+            "unix_ms": int(now * 1000),
+            "process_value_c": pv,
+            "setpoint_value_c": sv,
+            "unit_id": 4,
+            "last_read": ts
+        }
             
     except Exception as e:
         return {
@@ -434,9 +967,14 @@ async def get_omron_status():
 @app.get("/api/vfd/status")
 async def get_vfd_status():
     """Get current RS510 VFD status and readings."""
+    # Polled by the dashboard: return the response directly so FastAPI
+    # skips its jsonable_encoder pass over the dict
+    return OrjsonResponse(await run_blocking(_do_vfd_status))
+
+def _do_vfd_status():
     try:
         # Find FTDI port (same as Omron)
-        hardware_info = discover_hardware()
+        hardware_info = get_hardware_cached()
         ftdi_ports = hardware_info.get('ports', {}).get('ftdi', [])
         if not ftdi_ports:
             return {
@@ -446,45 +984,32 @@ async def get_vfd_status():
         
         port = ftdi_ports[0]['device']
         
-        # Create VFD controller
-        vfd = RS510VFDController(
-            port=port,
-            slave_id=3,  # Default RS510 VFD address (check your VFD configuration)
-            baudrate=9600,  # Standard VFD baud rate
-            timeout=2.0,
-            debug=False
-        )
-        
-        if not vfd.connect():
-            return {
-                "status": "connection_failed",
-                "error": "Failed to connect to RS510 VFD",
-                "port": port
-            }
+        # Default RS510 VFD address is 3 (check your VFD configuration)
+        with _rs485_lock:
+            vfd = get_vfd_controller(port, 3)
+            try:
+                state = vfd.get_status()
+            except Exception:
+                # Recreate the controller on the next request
+                reset_vfd_controller(port)
+                raise
         
-        try:
-            # Get VFD status
-            state = vfd.get_status()
-            
-            return {
-                "status": "connected",
-                "port": port,
-                "slave_id": 3,
-                "frequency_hz": state.frequency_hz,
-                "frequency_command_hz": state.frequency_command_hz,
-                "run_command": state.run_command.name,
-                "vfd_status": state.status.name,
-                "output_current_a": state.output_current_a,
-                "dc_bus_voltage_v": state.dc_bus_voltage_v,
-                "fault_code": state.fault_code,
-                "temperature_c": state.temperature_c,
-                "is_running": state.is_running,
-                "is_fault": state.is_fault,
-                "timestamp": state.timestamp
-            }
-            
-        finally:
-            vfd.disconnect()
+        return {
+            "status": "connected",
+            "port": port,
+            "slave_id": 3,
+            "frequency_hz": state.frequency_hz,
+            "frequency_command_hz": state.frequency_command_hz,
+            "run_command": state.run_command.name,
+            "vfd_status": state.status.name,
+            "output_current_a": state.output_current_a,
+            "dc_bus_voltage_v": state.dc_bus_voltage_v,
+            "fault_code": state.fault_code,
+            "temperature_c": state.temperature_c,
+            "is_running": state.is_running,
+            "is_fault": state.is_fault,
+            "timestamp": state.timestamp
+        }
             
     except Exception as e:
         return {
@@ -496,9 +1021,12 @@ async def get_vfd_status():
 @app.post("/api/vfd/control")
 async def control_vfd(command: VFDCommand):
     """Control RS510 VFD - start, stop, set frequency, etc."""
+    return await run_blocking(_do_vfd_control, command)
+
+def _do_vfd_control(command: VFDCommand):
     try:
         # Find FTDI port
-        hardware_info = discover_hardware()
+        hardware_info = get_hardware_cached()
         ftdi_ports = hardware_info.get('ports', {}).get('ftdi', [])
         if not ftdi_ports:
             return {
@@ -509,106 +1037,92 @@ async def control_vfd(command: VFDCommand):
         port = command.port or ftdi_ports[0]['device']
         slave_id = command.slave_id or 3  # Default RS510 VFD address
         
-        # Create VFD controller
-        vfd = RS510VFDController(
-            port=port,
-            slave_id=slave_id,
-            baudrate=9600,
-            timeout=2.0,
-            debug=False
-        )
-        
-        if not vfd.connect():
-            return {
-                "status": "connection_failed",
-                "error": "Failed to connect to RS510 VFD",
-                "port": port
-            }
-        
-        try:
-            success = False
-            result_msg = ""
+        with _rs485_lock:
+            vfd = get_vfd_controller(port, slave_id)
+            try:
+                success = False
+                result_msg = ""
             
-            # Execute command
-            if command.action == "status":
-                # Just return status
-                state = vfd.get_status()
-                return {
-                    "status": "success",
-                    "action": command.action,
-                    "data": {
-                        "frequency_hz": state.frequency_hz,
-                        "frequency_command_hz": state.frequency_command_hz,
-                        "run_command": state.run_command.name,
-                        "vfd_status": state.status.name,
-                        "is_running": state.is_running,
-                        "is_fault": state.is_fault,
-                        "fault_code": state.fault_code,
-                        "timestamp": state.timestamp
-                    }
-                }
-                
-            elif command.action == "set_frequency":
-                if command.frequency_hz is None:
+                # Execute command
+                if command.action == "status":
+                    # Just return status
+                    state = vfd.get_status()
                     return {
-                        "status": "error",
-                        "error": "Frequency value required for set_frequency command"
+                        "status": "success",
+                        "action": command.action,
+                        "data": {
+                            "frequency_hz": state.frequency_hz,
+                            "frequency_command_hz": state.frequency_command_hz,
+                            "run_command": state.run_command.name,
+                            "vfd_status": state.status.name,
+                            "is_running": state.is_running,
+                            "is_fault": state.is_fault,
+                            "fault_code": state.fault_code,
+                            "timestamp": state.timestamp
+                        }
                     }
-                success = vfd.set_frequency(command.frequency_hz)
-                result_msg = f"Set frequency to {command.frequency_hz} Hz"
                 
-            elif command.action == "start_forward":
-                success = vfd.start_forward(command.frequency_hz)
-                freq_msg = f" at {command.frequency_hz} Hz" if command.frequency_hz else ""
-                result_msg = f"Started motor forward{freq_msg}"
+                elif command.action == "set_frequency":
+                    if command.frequency_hz is None:
+                        return {
+                            "status": "error",
+                            "error": "Frequency value required for set_frequency command"
+                        }
+                    success = vfd.set_frequency(command.frequency_hz)
+                    result_msg = f"Set frequency to {command.frequency_hz} Hz"
                 
-            elif command.action == "start_reverse":
-                success = vfd.start_reverse(command.frequency_hz)
-                freq_msg = f" at {command.frequency_hz} Hz" if command.frequency_hz else ""
-                result_msg = f"Started motor reverse{freq_msg}"
+                elif command.action == "start_forward":
+                    success = vfd.start_forward(command.frequency_hz)
+                    freq_msg = f" at {command.frequency_hz} Hz" if command.frequency_hz else ""
+                    result_msg = f"Started motor forward{freq_msg}"
                 
-            elif command.action == "stop":
-                success = vfd.stop()
-                result_msg = "Stopped motor (controlled deceleration)"
+                elif command.action == "start_reverse":
+                    success = vfd.start_reverse(command.frequency_hz)
+                    freq_msg = f" at {command.frequency_hz} Hz" if command.frequency_hz else ""
+                    result_msg = f"Started motor reverse{freq_msg}"
                 
-            elif command.action == "emergency_stop":
-                success = vfd.emergency_stop()
-                result_msg = "Emergency stop executed"
+                elif command.action == "stop":
+                    success = vfd.stop()
+                    result_msg = "Stopped motor (controlled deceleration)"
                 
-            else:
-                return {
-                    "status": "error",
-                    "error": f"Unknown action: {command.action}"
-                }
-            
-            if success:
-                # Get updated status after command
-                import time
-                time.sleep(0.1)  # Brief delay for VFD to process command
-                state = vfd.get_status()
+                elif command.action == "emergency_stop":
+                    success = vfd.emergency_stop()
+                    result_msg = "Emergency stop executed"
                 
-                return {
-                    "status": "success",
-                    "action": command.action,
-                    "message": result_msg,
-                    "current_state": {
-                        "frequency_hz": state.frequency_hz,
-                        "frequency_command_hz": state.frequency_command_hz,
-                        "is_running": state.is_running,
-                        "is_fault": state.is_fault,
-                        "vfd_status": state.status.name
-                    },
-                    "timestamp": datetime.now().isoformat()
-                }
-            else:
-                return {
-                    "status": "command_failed",
-                    "error": f"VFD did not acknowledge command: {command.action}",
-                    "action": command.action
-                }
+                else:
+                    return {
+                        "status": "error",
+                        "error": f"Unknown action: {command.action}"
+                    }
+            
+                if success:
+                    # Get updated status after command
+                    time.sleep(0.1)  # Brief delay for VFD to process command
+                    state = vfd.get_status()
                 
-        finally:
-            vfd.disconnect()
+                    return {
+                        "status": "success",
+                        "action": command.action,
+                        "message": result_msg,
+                        "current_state": {
+                            "frequency_hz": state.frequency_hz,
+                            "frequency_command_hz": state.frequency_command_hz,
+                            "is_running": state.is_running,
+                            "is_fault": state.is_fault,
+                            "vfd_status": state.status.name
+                        },
+                        "timestamp": datetime.now().isoformat()
+                    }
+                else:
+                    return {
+                        "status": "command_failed",
+                        "error": f"VFD did not acknowledge command: {command.action}",
+                        "action": command.action
+                    }
+            except Exception:
+                # Recreate the controller on the next request
+                reset_vfd_controller(port)
+                raise
             
     except Exception as e:
         return {
@@ -619,7 +1133,8 @@ async def control_vfd(command: VFDCommand):
         }
 
 @app.get("/api/scope/waveform")
-async def get_scope_waveform(channel: str = "CHAN1", points: int = None):
+async def get_scope_waveform(channel: str = "CHAN1", points: int = None, raw_mode: bool = False,
+                             high_res: bool = False):
     """
     Get waveform data from oscilloscope channel for dashboard preview.
     Uses dashboard_preview settings from config for optimal performance.
@@ -627,138 +1142,159 @@ async def get_scope_waveform(channel: str = "CHAN1", points: int = None):
     Args:
         channel: Channel to capture (CHAN1, CHAN2, CHAN3, CHAN4)
         points: Number of points to capture (defaults to dashboard_preview.points from config)
+        raw_mode: Transfer up to `points` raw samples and decimate in Python
+            instead of letting the scope return at most MAX_WEB_POINTS
+        high_res: Transfer 16-bit WORD samples instead of 8-bit BYTE ones
+            (the preview cannot show the difference; BYTE halves the transfer)
     """
-    # Use lock to prevent concurrent oscilloscope access
-    with _scope_lock:
+    async with _scope_lock:
+        result = await run_blocking(_do_scope_waveform, channel, points, raw_mode, high_res)
+    # Returning the response directly skips FastAPI's jsonable_encoder walk
+    # over the sample lists; orjson encodes them in one C pass
+    return OrjsonResponse(result)
+
+def _do_scope_waveform(channel: str, points: Optional[int], raw_mode: bool = False,
+                       high_res: bool = False):
+    # Called with _scope_lock held (see get_scope_waveform)
+    try:
+        # Load config to get scope IP
+        config = load_config()
+        if config is None:
+            raise HTTPException(status_code=500, detail="Config file not found")
+        
+        scope_ip = config.get("scope_ip", "169.254.47.193")
+        
+        # Use dashboard preview settings if points not specified
+        if points is None:
+            preview_config = config.get("dashboard_preview", {})
+            points = preview_config.get("points", 1000)
+        
+        # Ensure we don't exceed scope limits  
+        points = min(points, 62500)
+        # Normally the scope decimates to what the web view shows, so
+        # only that many points cross the LAN
+        transfer_points = points if raw_mode else min(points, MAX_WEB_POINTS)
+        
+        # Reuse the open session; the TCP/VISA handshake happens only once
+        scope = get_scope_resource(scope_ip)
+        # Clear status and check for errors in one round trip (each VXI-11
+        # write or query is an RPC, so chained commands save whole RTTs)
+        error_response = scope.query('*CLS;:SYST:ERR?')
+        if not error_response.startswith('0,"No error"'):
+            print(f"Warning: Scope error before acquisition: {error_response}")
+        
+        # Configure waveform acquisition. SCPI commands on one session are
+        # executed in order, so the preamble query chained after them
+        # already sees these settings; no *OPC? round-trips are needed.
+        setup = [f':WAV:SOUR {channel}']
+        if raw_mode:
+            # Points mode persists on the scope; undo a preview's NORM
+            setup.append(':WAV:POIN:MODE RAW')
+        else:
+            setup.append(':WAV:POIN:MODE NORM')  # Decimated on the scope
+        # The session is reused, so set the sign mode explicitly for the
+        # datatype read below
+        if high_res:
+            # Host byte order: no byteswap on read
+            setup += [':WAV:FORMAT WORD', ':WAV:UNSIGNED 0', ':WAV:BYTEORDER LSBFirst']
+        else:
+            setup += [':WAV:FORMAT BYTE', ':WAV:UNSIGNED 1']
+        setup.append(f':WAV:POINTS {transfer_points}')
+        
+        # Send the setup and get the preamble for scaling in one query
+        preamble = scope.query(';'.join(setup) + ';:WAV:PRE?').strip().split(',')
+        
+        # Parse preamble (Keysight format) with error handling
         try:
-            import pyvisa
-            import json
-            
-            # Load config to get scope IP
-            config_path = Path(__file__).parent / "config.json"
-            if not config_path.exists():
-                raise HTTPException(status_code=500, detail="Config file not found")
-                
-            with open(config_path) as f:
-                config = json.load(f)
-            
-            scope_ip = config.get("scope_ip", "169.254.47.193")
-            
-            # Use dashboard preview settings if points not specified
-            if points is None:
-                preview_config = config.get("dashboard_preview", {})
-                points = preview_config.get("points", 1000)
-            
-            # Ensure we don't exceed scope limits  
-            points = min(points, 62500)
-            
-            # Connect to oscilloscope with optimized settings
-            rm = pyvisa.ResourceManager('@py')
-            scope = rm.open_resource(f'TCPIP::{scope_ip}::INSTR')
-            scope.timeout = 15000  # Increased timeout for dashboard preview
-            scope.write_termination = '\n'
-            scope.read_termination = '\n'
-            # Clear any existing errors and reset scope state
-            scope.write('*CLS')  # Clear status
-            scope.query('*OPC?')  # Wait for operation complete
-            
-            # Check for errors
-            error_response = scope.query('SYST:ERR?')
-            if not error_response.startswith('0,"No error"'):
-                print(f"Warning: Scope error before acquisition: {error_response}")
-            
-            # Configure waveform acquisition with proper sequencing and delays
-            scope.write(f':WAV:SOUR {channel}')
-            scope.query('*OPC?')  # Wait after source selection
-            
-            scope.write(':WAV:MODE RAW')
-            scope.write(':WAV:FORMAT WORD')  
-            scope.write(f':WAV:POINTS {points}')  # Use calculated points from config
-            
-            # Wait for all settings to take effect
-            scope.query('*OPC?')
-            
-            # Get preamble for scaling
-            preamble = scope.query(':WAV:PRE?').strip().split(',')
-            
-            # Parse preamble (Keysight format) with error handling
-            try:
-                format_type = int(preamble[0])  # 0=BYTE, 1=WORD, 4=ASCII
-                acq_type = int(preamble[1])     # 0=NORMAL, 1=PEAK, 2=AVERAGE
-                points_count = int(preamble[2])  # Number of data points
-                avg_count = int(preamble[3])     # Average count
-                x_increment = float(preamble[4]) # Time between points (s)
-                x_origin = float(preamble[5])    # Time of first point (s)
-                x_reference = int(preamble[6])   # Sample number of x_origin
-                y_increment = float(preamble[7]) # Voltage per LSB
-                y_origin = float(preamble[8])    # Voltage at center screen
-                y_reference = int(preamble[9])   # Sample value at y_origin
-            except (ValueError, IndexError) as e:
-                raise HTTPException(status_code=500, detail=f"Failed to parse preamble: {preamble[:100]}... Error: {e}")
-            
-            # Get raw waveform data
-            raw_data = scope.query_binary_values(':WAV:DATA?', datatype='h', is_big_endian=True)
-            
-            # Convert to voltage and time arrays with error handling
-            try:
-                voltage_data = [(point - y_reference) * y_increment + y_origin for point in raw_data]
-                time_data = [x_origin + (i - x_reference) * x_increment for i in range(len(raw_data))]
-                
-                # Validate data
-                if not voltage_data or not time_data:
-                    raise ValueError("Empty data arrays")
-                    
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Data conversion failed: {e}. Raw data length: {len(raw_data) if raw_data else 0}")
-            
-            # Prepare data for React (limit to reasonable size for web)
-            max_web_points = min(len(voltage_data), 2000)  # Limit for web display
-            step = len(voltage_data) // max_web_points if len(voltage_data) > max_web_points else 1
-            
-            web_voltage = voltage_data[::step][:max_web_points]
-            web_time = time_data[::step][:max_web_points]
-            
-            return {
-                "channel": channel,
-                "points_requested": points,
-                "points_captured": len(raw_data),
-                "points_returned": len(web_voltage),
-                "sample_rate_hz": 1.0 / x_increment if x_increment > 0 else 0,
-                "time_span_s": (time_data[-1] - time_data[0]) if len(time_data) > 1 else 0,
-                "voltage_range_v": [min(voltage_data), max(voltage_data)] if voltage_data else [0, 0],
-                "waveform": [
-                    {"x": t, "y": v} for t, v in zip(web_time, web_voltage)
-                ],
-                "timestamp": datetime.now().isoformat(),
-                "acquisition_info": {
-                    "format": "WORD",
-                    "mode": "RAW",
-                    "avg_count": avg_count,
-                    "x_increment": x_increment,
-                    "y_increment": y_increment,
-                    "preview_mode": True,
-                    "decimation_ratio": config.get("dashboard_preview", {}).get("decimation_ratio", 250)
-                }
+            (format_type, acq_type, points_count, avg_count,
+             x_increment, x_origin, x_reference,
+             y_increment, y_origin, y_reference) = [
+                conv(field) for conv, field in zip(_PRE_TYPES, preamble)]
+        except ValueError as e:
+            raise HTTPException(status_code=500, detail=f"Failed to parse preamble: {preamble[:100]}... Error: {e}")
+        
+        # Get raw waveform data as a native int16/uint8 view of the received
+        # block (pyvisa wraps it with np.frombuffer for ndarray containers)
+        raw_data = scope.query_binary_values(':WAV:DATA?', datatype='h' if high_res else 'B',
+                                             is_big_endian=False, container=np.ndarray)
+        n = len(raw_data)
+        
+        if n == 0:
+            raise HTTPException(status_code=500, detail="Data conversion failed: Empty data arrays. Raw data length: 0")
+        
+        # Prepare data for React (raw_mode: decimate here to the web limit)
+        max_web_points = min(n, MAX_WEB_POINTS)
+        step = n // max_web_points if n > max_web_points else 1
+        
+        # Scaling is affine, so only the returned samples are converted:
+        # volts and time are built from the decimated indices, and the
+        # voltage range from the min/max raw codes
+        web_index = np.arange(0, n, step)[:max_web_points]
+        # (cast before subtracting: uint8 codes would wrap around y_reference)
+        # Both stay ndarrays: OrjsonResponse serializes them without a
+        # per-sample Python float
+        web_voltage = ((raw_data[web_index].astype(np.float32) - y_reference)
+                       * y_increment + y_origin)
+        web_time = x_origin + (web_index - x_reference) * x_increment
+        lo, hi = ((float(code) - y_reference) * y_increment + y_origin
+                  for code in (raw_data.min(), raw_data.max()))
+        
+        return {
+            "channel": channel,
+            "points_requested": points,
+            "points_captured": len(raw_data),
+            "points_returned": len(web_voltage),
+            "sample_rate_hz": 1.0 / x_increment if x_increment > 0 else 0,
+            "time_span_s": (n - 1) * x_increment if n > 1 else 0,
+            "voltage_range_v": [min(lo, hi), max(lo, hi)],
+            # Parallel arrays: t[i] (s) belongs to v[i] (V)
+            "t": web_time,
+            "v": web_voltage,
+            "timestamp": datetime.now().isoformat(),
+            "acquisition_info": {
+                "format": "WORD" if high_res else "BYTE",
+                "mode": "RAW" if raw_mode else "NORMAL",
+                "avg_count": avg_count,
+                "x_increment": x_increment,
+                "y_increment": y_increment,
+                "preview_mode": True,
+                "decimation_ratio": config.get("dashboard_preview", {}).get("decimation_ratio", 250)
             }
-            
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Oscilloscope waveform capture failed: {str(e)}")
-        finally:
-            if 'scope' in locals():
-                scope.close()
+        }
+        
+    except HTTPException as e:
+        raise HTTPException(status_code=500, detail=f"Oscilloscope waveform capture failed: {e.detail}")
+    except Exception as e:
+        # Reconnect on the next request
+        reset_scope_resource()
+        raise HTTPException(status_code=500, detail=f"Oscilloscope waveform capture failed: {str(e)}")
 
 if __name__ == "__main__":
+    import argparse
+    import importlib.util
     import uvicorn
     
+    parser = argparse.ArgumentParser(description="Test Rig API server")
+    parser.add_argument("--reload", action="store_true",
+                        help="Restart on source changes (development only)")
+    args = parser.parse_args()
+    
     print("🚀 Starting Test Rig API Server...")
     print("📍 API will be available at: http://localhost:8000")
     print("📚 API docs at: http://localhost:8000/docs")
     print("🔄 React CORS enabled for: http://localhost:3000")
     
+    # uvloop/httptools come with uvicorn[standard], except uvloop on Windows;
+    # fall back to the stock asyncio loop and h11 parser when missing
+    has_uvloop = importlib.util.find_spec("uvloop") is not None
+    has_httptools = importlib.util.find_spec("httptools") is not None
+    
     uvicorn.run(
         "api_server:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=args.reload,
+        loop="uvloop" if has_uvloop else "asyncio",
+        http="httptools" if has_httptools else "h11",
         log_level="info"
     )
\ No newline at end of file
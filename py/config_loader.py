@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Shared loader for the JSON configuration files (config.json and friends).
+
+The parsed dict is memoized per file and only re-read when the file's
+mtime or size changes, so repeated loads cost one stat(). Treat the
+returned dict as read-only: it is shared by every caller.
+"""
+
+import functools
+import os
+
+import orjson
+
+
+@functools.lru_cache(maxsize=8)
+def _load_cached(path: str, mtime_ns: int, size: int) -> dict:
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def load(path="config.json") -> dict:
+    """
+    Parsed JSON config at path. Raises FileNotFoundError if it does not exist
+    and orjson.JSONDecodeError (a ValueError) if it is not valid JSON.
+    """
+    st = os.stat(path)
+    # Integer nanoseconds: float st_mtime can miss edits within its resolution
+    return _load_cached(os.path.abspath(path), st.st_mtime_ns, st.st_size)
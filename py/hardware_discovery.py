@@ -15,8 +15,7 @@ import argparse
 import json
 import logging
 import socket
-import subprocess
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -24,23 +23,17 @@ import serial
 import serial.tools.list_ports
 import pyvisa
 
-# Vendor/Product IDs for common devices
-DEVICE_IDS = {
-    'rp2040': [
-        {'vid': 0x2E8A, 'pid': 0x0005, 'desc': 'Raspberry Pi RP2040'},
-        {'vid': 0x2E8A, 'pid': 0x000A, 'desc': 'Seeed Studio XIAO RP2040'},
-        {'vid': 0x2886, 'pid': 0x8027, 'desc': 'Seeed Studio XIAO RP2040'},
-    ],
-    'ftdi': [
-        {'vid': 0x0403, 'pid': 0x6001, 'desc': 'FTDI FT232R'},
-        {'vid': 0x0403, 'pid': 0x6014, 'desc': 'FTDI FT232H'},
-        {'vid': 0x0403, 'pid': 0x6015, 'desc': 'FTDI FT-X'},
-    ]
-}
+import config_loader
+from hardware_utils import _VIDPID_MAP
 
-def discover_serial_ports():
-    """Discover and categorize serial ports by device type."""
-    ports = serial.tools.list_ports.comports()
+def discover_serial_ports(ports=None):
+    """
+    Discover and categorize serial ports by device type.
+    ports: result of serial.tools.list_ports.comports() if the caller
+    already enumerated them; enumerated here otherwise.
+    """
+    if ports is None:
+        ports = serial.tools.list_ports.comports()
     categorized = {'rp2040': [], 'ftdi': [], 'unknown': []}
     
     for port in ports:
@@ -56,22 +49,10 @@ def discover_serial_ports():
         }
         
         # Categorize by VID/PID
-        if port.vid and port.pid:
-            # Check for RP2040 variants
-            for device in DEVICE_IDS['rp2040']:
-                if port.vid == device['vid'] and port.pid == device['pid']:
-                    port_info['device_type'] = device['desc']
-                    categorized['rp2040'].append(port_info)
-                    break
-            else:
-                # Check for FTDI devices
-                for device in DEVICE_IDS['ftdi']:
-                    if port.vid == device['vid'] and port.pid == device['pid']:
-                        port_info['device_type'] = device['desc']
-                        categorized['ftdi'].append(port_info)
-                        break
-                else:
-                    categorized['unknown'].append(port_info)
+        hit = _VIDPID_MAP.get((port.vid, port.pid))
+        if hit:
+            category, port_info['device_type'] = hit
+            categorized[category].append(port_info)
         else:
             categorized['unknown'].append(port_info)
     
@@ -81,15 +62,13 @@ def test_rp2040_connection(port_device, timeout=2.0):
     """Test connection to RP2040 and get firmware info."""
     try:
         with serial.Serial(port_device, 115200, timeout=timeout) as ser:
-            # Send PING command
-            ser.write(b'PING\r\n')
-            time.sleep(0.1)
+            # Send PING and INFO in one write; readline() returns as soon as
+            # each reply's newline arrives (timeout only if the device is mute)
+            ser.write(b'PING\r\nINFO\r\n')
             
             response = ser.readline().decode('ascii', errors='ignore').strip()
             if response.startswith('OK PONG'):
                 # Get device info
-                ser.write(b'INFO\r\n')
-                time.sleep(0.1)
                 info_response = ser.readline().decode('ascii', errors='ignore').strip()
                 
                 return {
@@ -183,14 +162,18 @@ def test_rs485_connection(port_device, slave_id=1, timeout=2.0):
             'last_attempt': datetime.now().isoformat()
         }
 
-def discover_hardware(config=None):
-    """Main hardware discovery function."""
+def discover_hardware(config=None, ports=None, rp2040_probe=None):
+    """
+    Main hardware discovery function. ports: see discover_serial_ports().
+    rp2040_probe: replaces test_rp2040_connection(port_device), e.g. for a
+    caller that already holds the RP2040 port open and must not open it twice.
+    """
     result = {
         'timestamp': datetime.now().isoformat(),
         'scope': {'status': 'disconnected'},
         'rp2040': {'status': 'disconnected'},
         'rs485': {'status': 'disconnected'},
-        'ports': discover_serial_ports()
+        'ports': discover_serial_ports(ports)
     }
     
     # Test oscilloscope connection
@@ -198,22 +181,30 @@ def discover_hardware(config=None):
     if config and 'scope_ip' in config:
         scope_ip = config['scope_ip']
     
-    result['scope'] = test_scope_connection(scope_ip)
-    
-    # Test RP2040 connections
-    rp2040_ports = result['ports']['rp2040']
-    if rp2040_ports:
+    # The probes wait on independent devices, so run them concurrently:
+    # discovery takes as long as the slowest probe instead of their sum
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        scope_future = pool.submit(test_scope_connection, scope_ip)
+        
         # Test the first available RP2040
-        port_device = rp2040_ports[0]['device']
-        result['rp2040'] = test_rp2040_connection(port_device)
-        result['rp2040']['port'] = port_device
-    
-    # Test RS485/FTDI connections
-    ftdi_ports = result['ports']['ftdi']
-    if ftdi_ports:
-        # Test the first available FTDI device
-        port_device = ftdi_ports[0]['device']
-        result['rs485'] = test_rs485_connection(port_device)
+        rp2040_ports = result['ports']['rp2040']
+        rp2040_future = None
+        if rp2040_ports:
+            rp2040_device = rp2040_ports[0]['device']
+            rp2040_future = pool.submit(rp2040_probe or test_rp2040_connection, rp2040_device)
+        
+        # Test the first available FTDI device (RS485)
+        ftdi_ports = result['ports']['ftdi']
+        rs485_future = None
+        if ftdi_ports:
+            rs485_future = pool.submit(test_rs485_connection, ftdi_ports[0]['device'])
+        
+        result['scope'] = scope_future.result()
+        if rp2040_future is not None:
+            result['rp2040'] = rp2040_future.result()
+            result['rp2040']['port'] = rp2040_device
+        if rs485_future is not None:
+            result['rs485'] = rs485_future.result()
     
     return result
 
@@ -231,8 +222,7 @@ def main():
     # Load config if provided
     config = None
     if args.config and Path(args.config).exists():
-        with open(args.config) as f:
-            config = json.load(f)
+        config = config_loader.load(args.config)
     
     # Discover hardware
     hardware_info = discover_hardware(config)
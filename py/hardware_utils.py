@@ -8,6 +8,8 @@ Provides reusable functions for auto-detecting serial devices:
 - Other USB serial devices
 """
 
+import time
+
 import serial.tools.list_ports
 from typing import Optional, List, Dict, Any
 
@@ -26,6 +28,27 @@ DEVICE_IDS = {
     ]
 }
 
+# (vid, pid) -> (category, desc): one dict lookup per port instead of a scan
+_VIDPID_MAP = {(d['vid'], d['pid']): (category, d['desc'])
+               for category, devices in DEVICE_IDS.items() for d in devices}
+
+# Last comports() result, shared by the detect/list helpers below
+_comports_cache = {'ts': float('-inf'), 'ports': None}
+COMPORTS_TTL = 0.5  # seconds
+
+
+def _comports(max_age: float = COMPORTS_TTL):
+    """
+    serial.tools.list_ports.comports(), reused for max_age seconds so that
+    helpers called back to back (e.g. resolve_port for several devices at
+    startup) enumerate the USB bus once. max_age=0 forces a fresh listing.
+    """
+    now = time.monotonic()
+    if _comports_cache['ports'] is None or now - _comports_cache['ts'] >= max_age:
+        _comports_cache['ports'] = serial.tools.list_ports.comports()
+        _comports_cache['ts'] = now
+    return _comports_cache['ports']
+
 
 def detect_ftdi_port(prefer_serial_number: Optional[str] = None, debug: bool = False) -> Optional[str]:
     """
@@ -38,23 +61,21 @@ def detect_ftdi_port(prefer_serial_number: Optional[str] = None, debug: bool = F
     Returns:
         Device path (e.g., '/dev/tty.usbserial-FTDI485') or None if not found
     """
-    ports = serial.tools.list_ports.comports()
+    ports = _comports()
     ftdi_ports = []
 
     for port in ports:
-        if port.vid and port.pid:
-            # Check if this is an FTDI device
-            for device in DEVICE_IDS['ftdi']:
-                if port.vid == device['vid'] and port.pid == device['pid']:
-                    ftdi_ports.append({
-                        'device': port.device,
-                        'description': port.description,
-                        'serial_number': port.serial_number,
-                        'vid': port.vid,
-                        'pid': port.pid,
-                        'device_type': device['desc']
-                    })
-                    break
+        # Check if this is an FTDI device
+        hit = _VIDPID_MAP.get((port.vid, port.pid))
+        if hit and hit[0] == 'ftdi':
+            ftdi_ports.append({
+                'device': port.device,
+                'description': port.description,
+                'serial_number': port.serial_number,
+                'vid': port.vid,
+                'pid': port.pid,
+                'device_type': hit[1]
+            })
 
     if debug:
         print(f"[DEBUG] Found {len(ftdi_ports)} FTDI device(s)")
@@ -89,21 +110,19 @@ def detect_rp2040_port(debug: bool = False) -> Optional[str]:
     Returns:
         Device path (e.g., '/dev/tty.usbmodem14201') or None if not found
     """
-    ports = serial.tools.list_ports.comports()
+    ports = _comports()
     rp2040_ports = []
 
     for port in ports:
-        if port.vid and port.pid:
-            # Check if this is an RP2040 device
-            for device in DEVICE_IDS['rp2040']:
-                if port.vid == device['vid'] and port.pid == device['pid']:
-                    rp2040_ports.append({
-                        'device': port.device,
-                        'description': port.description,
-                        'serial_number': port.serial_number,
-                        'device_type': device['desc']
-                    })
-                    break
+        # Check if this is an RP2040 device
+        hit = _VIDPID_MAP.get((port.vid, port.pid))
+        if hit and hit[0] == 'rp2040':
+            rp2040_ports.append({
+                'device': port.device,
+                'description': port.description,
+                'serial_number': port.serial_number,
+                'device_type': hit[1]
+            })
 
     if debug:
         print(f"[DEBUG] Found {len(rp2040_ports)} RP2040 device(s)")
@@ -127,7 +146,7 @@ def list_all_serial_ports() -> List[Dict[str, Any]]:
     Returns:
         List of dictionaries with port information
     """
-    ports = serial.tools.list_ports.comports()
+    ports = _comports()
     result = []
 
     for port in ports:
@@ -143,15 +162,8 @@ def list_all_serial_ports() -> List[Dict[str, Any]]:
         }
 
         # Identify device type if known
-        device_type = 'unknown'
-        if port.vid and port.pid:
-            for category, devices in DEVICE_IDS.items():
-                for device in devices:
-                    if port.vid == device['vid'] and port.pid == device['pid']:
-                        device_type = f"{category}:{device['desc']}"
-                        break
-
-        port_info['device_type'] = device_type
+        hit = _VIDPID_MAP.get((port.vid, port.pid))
+        port_info['device_type'] = f"{hit[0]}:{hit[1]}" if hit else 'unknown'
         result.append(port_info)
 
     return result
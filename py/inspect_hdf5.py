@@ -11,29 +11,32 @@ def inspect_hdf5(filepath):
     print(f"\nInspecting: {filepath}\n")
     print("=" * 70)
 
+    # Collect all lines and write them in one go: a print() per attribute
+    # dominates the run time on files with many sweeps
+    lines = []
     with h5py.File(filepath, "r") as f:
         def print_attrs(name, obj):
-            """Print attributes of an HDF5 object."""
+            """Collect the lines for an HDF5 object and its attributes."""
             indent = "  " * name.count("/")
             if isinstance(obj, h5py.Group):
-                print(f"{indent}📁 {name.split('/')[-1] or '/'}")
+                lines.append(f"{indent}📁 {name.split('/')[-1] or '/'}")
             elif isinstance(obj, h5py.Dataset):
                 shape = obj.shape
                 dtype = obj.dtype
-                print(f"{indent}📊 {name.split('/')[-1]} {shape} {dtype}")
+                lines.append(f"{indent}📊 {name.split('/')[-1]} {shape} {dtype}")
 
-            # Print attributes
-            for key, val in obj.attrs.items():
-                print(f"{indent}  ├─ {key}: {val}")
+            # Attributes
+            lines.extend(f"{indent}  ├─ {key}: {val}" for key, val in obj.attrs.items())
 
         # Walk through all objects
         f.visititems(print_attrs)
 
-        # Print root attributes
-        print("\n📌 Root attributes:")
-        for key, val in f.attrs.items():
-            print(f"  ├─ {key}: {val}")
+        # Root attributes
+        lines.append("\n📌 Root attributes:")
+        lines.extend(f"  ├─ {key}: {val}" for key, val in f.attrs.items())
 
+    lines.append("")
+    sys.stdout.write("\n".join(lines))
     print("=" * 70)
 
 if __name__ == "__main__":
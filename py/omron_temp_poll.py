@@ -80,6 +80,14 @@ class E5CCTool:
         raw = self._read_u16(self.sv_address)
         return raw * self.scale
 
+    def read_pv_sv_c(self) -> Tuple[float, float]:
+        """Read PV and SV back-to-back while holding the shared bus (one transaction)."""
+        # PV/SV lie 0x103 registers apart, too far for one block read (max 125)
+        with self.manager.acquire_connection():
+            pv_raw = self._read_u16(self.pv_address)
+            sv_raw = self._read_u16(self.sv_address)
+        return pv_raw * self.scale, sv_raw * self.scale
+
     def write_sv_c(self, value_c: float):
         raw = int(round(value_c / self.scale))
         if not (0 <= raw <= 0xFFFF):
@@ -3,7 +3,13 @@ import argparse
 import h5py
 import numpy as np
 import plotly.graph_objects as go
+try:
+    import hdf5plugin  # noqa: F401  registers the bitshuffle/LZ4 filters
+except ImportError:
+    pass
 from utils.analysis import compute_fft, compute_spectrogram
+from utils.waveform import (scale_raw, decimate_minmax, scale_envelope,
+                            LazyVoltage, index_time, time_axis)
 
 CHAN_COLORS = {
     "CHAN1": "yellow",
@@ -12,35 +18,102 @@ CHAN_COLORS = {
     "CHAN4": "red",
 }
 
-def list_sweeps(h5file):
-    with h5py.File(h5file, "r") as f:
-        if "sweeps" not in f:
-            return []
-        return sorted(f["sweeps"].keys())
+# Traces longer than this are min/max-decimated before they go to Plotly
+MAX_PTS = 50_000
 
+# Chunk cache sized to hold several ~1 MiB chunks (see acquire_scope_data.CHUNK_BYTES)
+H5_CACHE = {"rdcc_nbytes": 8 * 1024 * 1024, "rdcc_nslots": 521}
 
-def list_channels(h5file, sweep_id):
-    with h5py.File(h5file, "r") as f:
-        grp = f[f"sweeps/{sweep_id}"]
-        return [k for k in grp.keys() if k != "digital"]
 
+# Files written with store.layout="channels" keep one 2D channels/<alias>/raw
+# dataset per channel (row = sweep) instead of sweeps/sweep_XXX groups.
 
-def load_waveform(h5file, sweep_id, channel_alias):
-    with h5py.File(h5file, "r") as f:
-        grp = f[f"sweeps/{sweep_id}/{channel_alias}"]
-        t = grp["time"][:]
-        v = grp["voltage"][:]
-        attrs = dict(grp.attrs)
+
+def list_sweeps(h5f):
+    if "sweeps" in h5f:
+        return sorted(h5f["sweeps"].keys())
+    if "channels" in h5f and len(h5f["channels"]):
+        first = next(iter(h5f["channels"].values()))
+        return [f"sweep_{i:03d}" for i in range(first["raw"].shape[0])]
+    return []
+
+
+def list_channels(h5f, sweep_id):
+    if "sweeps" not in h5f and "channels" in h5f:
+        return list(h5f["channels"].keys())
+    grp = h5f[f"sweeps/{sweep_id}"]
+    return [k for k in grp.keys() if k != "digital"]
+
+
+def open_dataset(grp, name):
+    """
+    Open a dataset so that, if it uses external storage (store.external_raw),
+    its .raw file is looked up next to the .h5 file rather than in the
+    current working directory. Must be the first open of that dataset.
+    """
+    dapl = h5py.h5p.create(h5py.h5p.DATASET_ACCESS)
+    dapl.set_efile_prefix(b"${ORIGIN}")
+    return h5py.Dataset(h5py.h5d.open(grp.id, name.encode(), dapl=dapl))
+
+
+def channel_source(h5f, sweep_id, channel_alias):
+    """(group, raw dataset or None, row or None) for one sweep of a channel."""
+    if "sweeps" not in h5f and "channels" in h5f:
+        grp = h5f[f"channels/{channel_alias}"]
+        return grp, grp["raw"], int(sweep_id.rsplit("_", 1)[-1])
+    grp = h5f[f"sweeps/{sweep_id}/{channel_alias}"]
+    raw_ds = open_dataset(grp, "voltage_raw") if "voltage_raw" in grp else None
+    return grp, raw_ds, None
+
+
+def load_waveform(h5f, sweep_id, channel_alias, max_points=None, lazy=False):
+    """
+    Load one channel from an already-open h5py.File.
+    With max_points, raw-code channels come back min/max-decimated and only
+    the kept samples are scaled.
+    With lazy, raw-code channels come back as (None, LazyVoltage, attrs):
+    nothing is read until the voltage is sliced, and time_axis() gives
+    the matching time axis.
+    """
+    grp, raw_ds, row = channel_source(h5f, sweep_id, channel_alias)
+    attrs = dict(grp.attrs)
+    # read_direct fills our own buffer instead of an h5py temporary
+    if raw_ds is not None:
+        if lazy:
+            return None, LazyVoltage(raw_ds, attrs["y_increment"], attrs["y_origin"],
+                                     attrs["y_reference"], row), attrs
+        if row is None:
+            raw = np.empty(raw_ds.shape, raw_ds.dtype)
+            raw_ds.read_direct(raw)
+        else:
+            raw = np.empty(raw_ds.shape[1:], raw_ds.dtype)
+            raw_ds.read_direct(raw, source_sel=np.s_[row, :])
+        if max_points:
+            idx, v = scale_envelope(raw, attrs["y_increment"], attrs["y_origin"],
+                                    attrs["y_reference"], max_points)
+            t = index_time(attrs, idx)
+            return t, v, attrs
+        v = scale_raw(raw, attrs["y_increment"], attrs["y_origin"], attrs["y_reference"])
+    else:
+        v_ds = grp["voltage"]
+        v = np.empty(v_ds.shape, v_ds.dtype)
+        v_ds.read_direct(v)
+
+    if "time" in grp:
+        t_ds = grp["time"]
+        t = np.empty(t_ds.shape, t_ds.dtype)
+        t_ds.read_direct(t)
+    else:
+        t = time_axis(attrs, 0, v.shape[0])
     return t, v, attrs
 
 
-def load_meta_header(h5file):
+def load_meta_header(h5f):
     header = {}
-    with h5py.File(h5file, "r") as f:
-        if "metadata" in f:
-            mg = f["metadata"]
-            header["created_utc"] = mg.attrs.get("created_utc", "")
-            header["scope_idn"] = mg.attrs.get("scope_idn", "")
+    if "metadata" in h5f:
+        mg = h5f["metadata"]
+        header["created_utc"] = mg.attrs.get("created_utc", "")
+        header["scope_idn"] = mg.attrs.get("scope_idn", "")
     return header
 
 
@@ -66,7 +139,8 @@ def plot_time_overlays(traces, title, subtitle):
     fig = go.Figure()
     for alias, (t, v, label, source) in traces.items():
         color = CHAN_COLORS.get(source, None)
-        fig.add_trace(go.Scatter(
+        t, v = decimate_minmax(t, v, MAX_PTS)
+        fig.add_trace(go.Scattergl(
             x=t, y=v, mode="lines", name=label,
             line=dict(color=color) if color else {}
         ))
@@ -79,7 +153,8 @@ def plot_fft_overlays(traces, title, subtitle):
     fig = go.Figure()
     for alias, (f, mag, label, source) in traces.items():
         color = CHAN_COLORS.get(source, None)
-        fig.add_trace(go.Scatter(
+        f, mag = decimate_minmax(f, mag, MAX_PTS)
+        fig.add_trace(go.Scattergl(
             x=f, y=mag, mode="lines", name=label,
             line=dict(color=color) if color else {}
         ))
@@ -90,7 +165,11 @@ def plot_fft_overlays(traces, title, subtitle):
 
 def plot_spectrogram(v, fs, title):
     f_spec, t_spec, Sxx = compute_spectrogram(v, fs)
-    fig = go.Figure(data=go.Heatmap(z=10 * np.log10(Sxx), x=t_spec, y=f_spec))
+    # dB in float32 (halves the heatmap payload); 10*log10(x) = log2(x) * 10/log2(10)
+    z = np.full(Sxx.shape, -np.inf, dtype=np.float32)
+    np.log2(Sxx, out=z, where=Sxx > 0)
+    z *= np.float32(10.0 / np.log2(10.0))
+    fig = go.Figure(data=go.Heatmap(z=z, x=t_spec, y=f_spec))
     fig.update_layout(title=title, xaxis_title="Time (s)", yaxis_title="Frequency (Hz)")
     fig.show()
 
@@ -105,41 +184,55 @@ def main():
     p.add_argument("--fft", action="store_true", help="Also show FFT overlays for selected channels.")
     p.add_argument("--spectrogram", action="store_true",
                    help="Show spectrogram for the first selected channel.")
+    p.add_argument("--samples", default=None,
+                   help="Sample window 'START:STOP' to load (e.g. '0:100000'). Default: whole record.")
     args = p.parse_args()
+    window = slice(*[int(x) if x else None for x in args.samples.split(":")]) if args.samples else None
 
-    sweeps = list_sweeps(args.h5file)
-    if not sweeps:
-        raise SystemExit("No sweeps found in HDF5.")
-    sweep_id = args.sweep or sweeps[0]
-
-    available = list_channels(args.h5file, sweep_id)
-    if not available:
-        raise SystemExit(f"No analog channels found in {sweep_id}.")
-    chosen = [c.strip() for c in args.channels.split(",")] if args.channels else available
-
-    header = load_meta_header(args.h5file)
-    subtitle = " • ".join([x for x in [
-        header.get("scope_idn", ""),
-        header.get("created_utc", "")
-    ] if x])
-
-    # --- Time domain overlays
+    # Time overlays alone only need the plotted envelope
+    max_points = None if (args.fft or args.spectrogram) else MAX_PTS
     time_traces = {}
     first_fs = None
     first_alias = None
-    for alias in chosen:
-        if alias not in available:
-            print(f"Warning: channel '{alias}' not in {sweep_id}. Available: {available}")
-            continue
-        
-        t, v, attrs = load_waveform(args.h5file, sweep_id, alias)
-        label = channel_legend(alias, attrs)
-        source = attrs.get("source", "")
-        time_traces[alias] = (t, v, label, source)
-
-        if first_fs is None:
-            first_fs = attrs.get("sample_rate", 1.0 / (t[1] - t[0]))
-            first_alias = alias
+    # One open for listing, header and all channel loads
+    with h5py.File(args.h5file, "r", **H5_CACHE) as h5f:
+        sweeps = list_sweeps(h5f)
+        if not sweeps:
+            raise SystemExit("No sweeps found in HDF5.")
+        sweep_id = args.sweep or sweeps[0]
+
+        available = list_channels(h5f, sweep_id)
+        if not available:
+            raise SystemExit(f"No analog channels found in {sweep_id}.")
+        chosen = [c.strip() for c in args.channels.split(",")] if args.channels else available
+
+        header = load_meta_header(h5f)
+        subtitle = " • ".join([x for x in [
+            header.get("scope_idn", ""),
+            header.get("created_utc", "")
+        ] if x])
+
+        # --- Time domain overlays
+        for alias in chosen:
+            if alias not in available:
+                print(f"Warning: channel '{alias}' not in {sweep_id}. Available: {available}")
+                continue
+
+            if window is not None:
+                # Read only the requested window of the raw codes
+                t, v, attrs = load_waveform(h5f, sweep_id, alias, lazy=True)
+                start, stop, _ = window.indices(len(v))
+                v = v[start:stop]
+                t = time_axis(attrs, start, stop) if t is None else t[start:stop]
+            else:
+                t, v, attrs = load_waveform(h5f, sweep_id, alias, max_points)
+            label = channel_legend(alias, attrs)
+            source = attrs.get("source", "")
+            time_traces[alias] = (t, v, label, source)
+
+            if first_fs is None:
+                first_fs = attrs.get("sample_rate", 1.0 / (t[1] - t[0]))
+                first_alias = alias
 
     if not time_traces:
         raise SystemExit("Nothing to plot (no valid channels).")
@@ -149,15 +242,15 @@ def main():
     # --- FFT overlays
     if args.fft:
         fft_traces = {}
-        for alias, (t, v, label) in time_traces.items():
+        for alias, (t, v, label, source) in time_traces.items():
             fs = 1.0 / (t[1] - t[0])
             f, mag = compute_fft(v, fs)
-            fft_traces[alias] = (f, mag, label.replace("(", "FFT ("))
+            fft_traces[alias] = (f, mag, label.replace("(", "FFT ("), source)
         plot_fft_overlays(fft_traces, title=f"FFT • {args.h5file} • {sweep_id}", subtitle=subtitle)
 
-    # --- Spectrogram (first selected channel only)
+    # --- Spectrogram (first selected channel only, reuses the loaded trace)
     if args.spectrogram:
-        t, v, _ = load_waveform(args.h5file, sweep_id, first_alias)
+        t, v, _, _ = time_traces[first_alias]
         fs = 1.0 / (t[1] - t[0])
         plot_spectrogram(v, fs, title=f"Spectrogram • {first_alias} • {sweep_id}")
 
@@ -6,6 +6,9 @@ import pyvisa
 
 SCOPE_CACHE_FILE = "scope_cache.json"
 
+# Stor modtagebuffer, så en hel :WAV:DATA? blok kan stå i kernen
+SOCK_RCVBUF = 4 * 1024 * 1024
+
 DEFAULT_PORT_LIST = [5025, 5555, 4000, 4980]
 DEFAULT_HOST_CANDIDATES = [
     "msox-2024a",
@@ -42,6 +45,9 @@ class BaseScope:
     def query_binary(self, cmd: str) -> bytes:
         raise NotImplementedError
 
+    def close(self):
+        pass
+
     def idn(self):
         try:
             return self.query("*IDN?")
@@ -52,42 +58,107 @@ class BaseScope:
 # ------------------- SocketScope -------------------
 
 class SocketScope(BaseScope):
+    """
+    Én vedvarende TCP-forbindelse (SCPI raw socket) for hele sessionen.
+    Svar læses linje for linje fra en fælles modtagebuffer, så bytes der
+    ankommer sammen med et svar ikke går tabt til det næste.
+    """
+
     def __init__(self, host, port):
         self.host = host
         self.port = port
-
-    def _open(self):
-        return socket.create_connection((self.host, self.port), timeout=3.0)
+        self._sock = None
+        self._rx = bytearray()
+
+    def _conn(self):
+        if self._sock is None:
+            s = socket.create_connection((self.host, self.port), timeout=3.0)
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_RCVBUF)
+            self._sock = s
+            self._rx = bytearray()
+        return self._sock
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+                self._rx = bytearray()
+
+    def _send(self, cmd: str):
+        self._conn().sendall((cmd + "\n").encode("ascii"))
+
+    def _fill(self):
+        buf = self._sock.recv(65536)
+        if not buf:
+            raise ConnectionError("Scope lukkede forbindelsen")
+        self._rx += buf
+
+    def _read_line(self) -> bytes:
+        while True:
+            i = self._rx.find(b"\n")
+            if i >= 0:
+                line = bytes(self._rx[:i+1])
+                del self._rx[:i+1]
+                return line
+            self._fill()
 
     def write(self, cmd: str):
-        s = self._open()
         try:
-            s.sendall((cmd + "\n").encode("ascii"))
-        finally:
-            s.close()
+            self._send(cmd)
+        except OSError:
+            self.close()
+            raise
 
     def query(self, cmd: str) -> str:
-        s = self._open()
         try:
-            s.sendall((cmd + "\n").encode("ascii"))
-            data = s.recv(65536)
-            return data.decode(errors="ignore")
-        finally:
-            s.close()
+            self._send(cmd)
+            return self._read_line().decode(errors="ignore")
+        except OSError:
+            # Timeout/afbrud: stream'en er ude af sync, så forbind på ny næste gang
+            self.close()
+            raise
 
     def query_binary(self, cmd: str) -> bytes:
-        s = self._open()
+        """
+        Læser IEEE 488.2 blokken direkte ind i én forhåndsallokeret bytearray
+        (størrelsen kendes fra headeren), i stedet for at samle chunks.
+        Den afsluttende newline efter blokken forbruges også.
+        """
         try:
-            s.sendall((cmd + "\n").encode("ascii"))
-            chunks = []
-            while True:
-                buf = s.recv(65536)
-                if not buf:
-                    break
-                chunks.append(buf)
-            return b"".join(chunks)
-        finally:
-            s.close()
+            self._send(cmd)
+            while len(self._rx) < 2:
+                self._fill()
+            if self._rx[:1] != b"#":
+                return self._read_line()
+            nd = self._rx[1] - 0x30
+            if not 1 <= nd <= 9:
+                # "#0" (ubestemt længde) og ødelagte headere understøttes ikke
+                raise ValueError(f"Ugyldig blok-header: {bytes(self._rx[:2])!r}")
+            while len(self._rx) < 2 + nd:
+                self._fill()
+            total = 2 + nd + int(self._rx[2:2+nd])
+
+            data = bytearray(total)
+            got = min(len(self._rx), total)
+            data[:got] = self._rx[:got]
+            del self._rx[:got]
+            view = memoryview(data)
+            while got < total:
+                n = self._sock.recv_into(view[got:])
+                if not n:
+                    raise ConnectionError("Scope lukkede forbindelsen midt i blokken")
+                got += n
+            del view
+
+            self._read_line()
+            return data
+        except (OSError, ValueError):
+            # Ulæste data ville forskyde næste svar, så forbindelsen lukkes
+            self.close()
+            raise
 
 
 # ------------------- VisaScope -------------------
@@ -98,6 +169,13 @@ class VisaScope(BaseScope):
         rm = pyvisa.ResourceManager()
         self.dev = rm.open_resource(resource)
         self.dev.timeout = 5000
+        if "TCPIP" in resource.upper():
+            # Som SocketScope: ingen Nagle-forsinkelse på korte SCPI-kommandoer.
+            # Ikke alle backends understøtter attributten på INSTR-sessioner
+            try:
+                self.dev.set_visa_attribute(pyvisa.constants.VI_ATTR_TCPIP_NODELAY, True)
+            except Exception:
+                pass
 
     def write(self, cmd: str):
         self.dev.write(cmd)
@@ -106,7 +184,12 @@ class VisaScope(BaseScope):
         return self.dev.query(cmd)
 
     def query_binary(self, cmd: str) -> bytes:
-        return bytes(self.dev.query_binary_values(cmd, datatype='B', container=bytearray))
+        # datatype 's' giver hele blokken som ét bytes-objekt; 'B' pakkede
+        # hver sample ud som en Python-int og samlede dem igen
+        return self.dev.query_binary_values(cmd, datatype='s', container=bytes)
+
+    def close(self):
+        self.dev.close()
 
 
 # ------------------- Helper functions -------------------
@@ -177,6 +260,7 @@ class ScopeManager:
         self.scope = None
         self.host = None
         self.port = None
+        self._idn = None
 
         # Brug config port override (hvis sat)
         if preferred_port:
@@ -233,5 +317,20 @@ class ScopeManager:
     def query_binary(self, cmd: str):
         return self.scope.query_binary(cmd)
 
+    def close(self):
+        # Næste forbindelse kan være et andet scope
+        self._idn = None
+        if self.scope is not None:
+            self.scope.close()
+
     def idn(self):
-        return self.scope.idn() if self.scope else "NO_SCOPE"
+        # *IDN? ændrer sig ikke for en forbindelse, så svaret caches;
+        # "UNKNOWN" (fejlet forespørgsel) caches ikke, så der prøves igen
+        if self.scope is None:
+            return "NO_SCOPE"
+        if self._idn is None:
+            idn = self.scope.idn()
+            if idn == "UNKNOWN":
+                return idn
+            self._idn = idn
+        return self._idn
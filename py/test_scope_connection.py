@@ -31,13 +31,13 @@ def test_connection(ip="169.254.196.182"):
         acq_type = scope.query(":ACQ:TYPE?").strip()
         print(f"✓ Acquisition type: {acq_type}")
 
-        # Query channel status
-        for ch in range(1, 5):
-            try:
-                disp = scope.query(f":CHAN{ch}:DISP?").strip()
+        # Query channel status (one compound query, replies separated by ';')
+        try:
+            disps = scope.query(";".join(f":CHAN{ch}:DISP?" for ch in range(1, 5))).strip().split(";")
+            for ch, disp in enumerate(disps, start=1):
                 print(f"✓ Channel {ch} display: {disp}")
-            except Exception as e:
-                print(f"  Channel {ch} query failed: {e}")
+        except Exception as e:
+            print(f"  Channel query failed: {e}")
 
         scope.close()
         print("\n✓ Connection test PASSED")
@@ -4,8 +4,14 @@
 # You can optionally expose utility functions here for easier import.
 
 from .analysis import compute_fft, compute_spectrogram
+from .waveform import scale_raw, decimate_minmax, scale_envelope, LazyVoltage, time_axis
 
 __all__ = [
     "compute_fft",
-    "compute_spectrogram"
+    "compute_spectrogram",
+    "scale_raw",
+    "decimate_minmax",
+    "scale_envelope",
+    "LazyVoltage",
+    "time_axis"
 ]
\ No newline at end of file
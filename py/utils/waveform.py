@@ -0,0 +1,109 @@
+import numpy as np
+
+
+def scale_raw(raw, y_increment, y_origin, y_reference, out=None):
+    """
+    Convert raw scope ADC codes to volts (float32).
+    Pass a float32 `out` of the same shape to reuse a buffer across calls.
+    """
+    if out is None:
+        out = np.empty(np.shape(raw), dtype=np.float32)
+    # The int16 -> float32 cast is fused into the subtract; then in-place ops,
+    # so the data is touched three times with no temporaries
+    np.subtract(raw, np.float32(y_reference), out=out, dtype=np.float32)
+    out *= np.float32(y_increment)
+    out += np.float32(y_origin)
+    return out
+
+
+def index_time(attrs, idx):
+    """Sample indices -> time (s) from the x_increment/x_origin/x_reference attrs."""
+    return (idx - attrs["x_reference"]) * attrs["x_increment"] + attrs["x_origin"]
+
+
+def time_axis(attrs, start, stop):
+    """
+    Time axis for samples [start, stop). Channels store no time dataset;
+    the axis is affine in the sample index and rebuilt on demand.
+    """
+    return index_time(attrs, np.arange(start, stop, dtype=np.float64))
+
+
+def minmax_indices(y, max_points):
+    """
+    Indices of the min and max of each bucket, in time order, so that at most
+    max_points samples remain and peaks survive the decimation.
+    """
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+
+    size = -(-n // max(1, max_points // 2))
+    nb = n // size
+    blocks = y[:nb * size].reshape(nb, size)
+    base = np.arange(nb) * size
+    i_min = base + blocks.argmin(axis=1)
+    i_max = base + blocks.argmax(axis=1)
+    idx = np.stack([np.minimum(i_min, i_max), np.maximum(i_min, i_max)], axis=1).ravel()
+
+    if nb * size < n:
+        tail = y[nb * size:]
+        t_min = nb * size + int(tail.argmin())
+        t_max = nb * size + int(tail.argmax())
+        idx = np.concatenate([idx, [min(t_min, t_max), max(t_min, t_max)]])
+
+    return idx
+
+
+def decimate_minmax(x, y, max_points):
+    """Min/max-decimate (x, y) to at most max_points samples."""
+    if len(y) <= max_points:
+        return x, y
+    idx = minmax_indices(y, max_points)
+    return x[idx], y[idx]
+
+
+def scale_envelope(raw, y_increment, y_origin, y_reference, max_points):
+    """
+    Min/max-decimate raw ADC codes and scale only the kept samples.
+    The scaling is affine, so the envelope of the codes is the envelope of
+    the volts; the full-length float32 array is never built.
+    Returns (idx, volts).
+    """
+    idx = minmax_indices(raw, max_points)
+    return idx, scale_raw(raw[idx], y_increment, y_origin, y_reference)
+
+
+class LazyVoltage:
+    """
+    Volts view of a raw-code HDF5 dataset. Nothing is read until it is
+    sliced; v[a:b] reads and scales only that window.
+    The dataset's file must stay open while the view is used.
+    With row, the view is that row of a 2D (sweeps, samples) dataset.
+    """
+
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, raw_ds, y_increment, y_origin, y_reference, row=None):
+        self.raw_ds = raw_ds
+        self.y_increment = y_increment
+        self.y_origin = y_origin
+        self.y_reference = y_reference
+        self.row = row
+
+    @property
+    def shape(self):
+        return self.raw_ds.shape if self.row is None else self.raw_ds.shape[1:]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, s):
+        if self.row is not None:
+            s = (self.row, slice(None)) if s == () else (self.row, s)
+        return scale_raw(np.asarray(self.raw_ds[s]),
+                         self.y_increment, self.y_origin, self.y_reference)
+
+    def __array__(self, dtype=None, copy=None):
+        v = self[()]
+        return v if dtype is None else v.astype(dtype, copy=False)
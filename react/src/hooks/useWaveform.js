@@ -29,10 +29,10 @@ export function useWaveform() {
       
       const data = await response.json();
       
-      // Transform API data for Recharts
-      const chartData = data.waveform.map(point => ({
-        x: point.x * 1000, // Convert to milliseconds for better display
-        y: point.y        // Voltage in volts
+      // Transform API data (parallel t/v arrays) for Recharts
+      const chartData = data.t.map((t, i) => ({
+        x: t * 1000,  // Convert to milliseconds for better display
+        y: data.v[i]  // Voltage in volts
       }));
       
       setWaveformData({